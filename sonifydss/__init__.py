@@ -0,0 +1,20 @@
+"""
+SonifyDSS as a library. sonify-dss.py is just the command line (sonifydss.cli) around it.
+
+The whole of a sonification is a Sonifier (sonifydss.sonifier); the pieces it is made of are in
+the other modules. Only numpy is needed to import the core of it: everything else (astropy,
+matplotlib, ffmpeg, sounddevice, ...) is imported by the features that use it, so importing
+this never touches the network or an audio device.
+
+Andy Newsam 01/03/2025
+"""
+
+__all__ = ["Sonifier"]
+
+
+# Sonifier is only imported when it is first used
+def __getattr__(name):
+    if(name == "Sonifier"):
+        from sonifydss.sonifier import Sonifier
+        return Sonifier
+    raise AttributeError("module 'sonifydss' has no attribute '"+name+"'")
@@ -0,0 +1,58 @@
+"""
+Fewer partials than pixels (--bands).
+
+Neighbouring rows (or columns, or rings) are grouped into bands, each of which becomes a single
+partial whose envelope is the mean, the maximum or the energy (root mean square) of its rows at
+every point. The points along the "sweep" are all kept, so the envelopes are as detailed as
+before, but the sound only costs as much to generate as there are bands, however big the image.
+
+    rows = bandRows(rows, 256, "max")   # (channels, 4096, points) -> (channels, 256, points)
+"""
+
+import numpy as np
+
+from sonifydss.mapped import LazyRows
+
+# The ways the rows of a band can be combined
+BAND_AGGREGATES = ["mean", "max", "energy"]
+
+
+# The first row of each of numBands bands of (nearly) the same number of rows, and one past the last row
+def bandEdges(numSnds, numBands):
+    return np.round(np.linspace(0, numSnds, numBands+1)).astype(np.intp)
+
+# Combine rows (channels, rows, points) into bands (channels, bands, points), the bands
+# starting at edges[:-1] and ending at edges[1:]
+def aggregateBands(rows, edges, how="mean"):
+    starts = edges[:-1] - edges[0]
+    if(how == "max"):
+        return np.maximum.reduceat(rows, starts, axis=1)
+    counts = np.diff(edges)[:, None]
+    if(how == "energy"):
+        return np.sqrt(np.add.reduceat(np.square(rows), starts, axis=1) / counts)
+    if(how == "mean"):
+        return np.add.reduceat(rows, starts, axis=1) / counts
+    raise ValueError("Unknown way to combine the rows of a band: "+str(how)+" (can be "+", ".join(BAND_AGGREGATES)+")")
+
+# Bands read from rows that are themselves read as they are needed (see sonifydss.mapped)
+class BandRows(LazyRows):
+
+    def __init__(self, rows, edges, how="mean"):
+        super().__init__(rows.imgs, (len(edges)-1, rows.shape[2]))
+        self.rows = rows
+        self.edges = edges
+        self.how = how
+
+    def _read(self, cs, p0, p1, k0, k1):
+        _e = self.edges[p0:p1+1]
+        return aggregateBands(self.rows[cs, _e[0]:_e[-1], k0:k1], _e, self.how)
+
+# The rows (channels, rows, points) combined into numBands bands, or left alone if there are
+# no more rows than that
+def bandRows(rows, numBands, how="mean"):
+    if(numBands >= rows.shape[1]):
+        return rows
+    edges = bandEdges(rows.shape[1], numBands)
+    if(isinstance(rows, LazyRows)):
+        return BandRows(rows, edges, how)
+    return aggregateBands(rows, edges, how).astype(rows.dtype, copy=False)
@@ -0,0 +1,155 @@
+"""
+Running many sonifications in one process.
+
+A manifest (CSV with a header row, or YAML) lists the jobs, each with the same settings as
+the command line (object, angsize, outfile, soundlen, direction, ...). The jobs are run on a
+pool of threads, which is worthwhile because nearly all of the work is in numpy, which lets
+other threads run while it works. Everything that is worth keeping between jobs is kept: the
+images of each field are fetched once and shared by all the jobs that use them (and dropped once
+the last of those is done), and the sampling indices and IFFT kernels are cached by the
+functions that make them. The time spent in each stage of each job is recorded, and
+batchSummary() puts it all together for writing out as JSON.
+"""
+
+import csv
+import os
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# The order the stages of a job happen in (for the summary)
+STAGES = ["fetch", "picture", "sample", "synthesize", "write", "movie"]
+
+
+# ---- Manifests
+
+# Read the jobs from a manifest: a CSV file with a header row naming the settings, or a YAML
+# file with a list of jobs (or a "jobs:" list). Returns a list of dictionaries.
+def readManifest(filename):
+    _, ext = os.path.splitext(filename)
+    if(ext.lower() in (".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("Reading YAML manifests needs PyYAML (pip install pyyaml), or use a CSV manifest")
+        with open(filename) as f:
+            jobs = yaml.safe_load(f)
+        if(isinstance(jobs, dict)):
+            jobs = jobs.get("jobs")
+        if(not isinstance(jobs, list)):
+            raise ValueError("The YAML manifest "+filename+" should be a list of jobs")
+        return [dict(j) for j in jobs]
+
+    # CSV, ignoring blank lines and lines starting with a #
+    with open(filename, newline="") as f:
+        lines = [l for l in f if l.strip() and not l.lstrip().startswith("#")]
+    return [{k.strip(): v.strip() for k, v in row.items() if k and v is not None and v.strip() != ""}
+            for row in csv.DictReader(lines)]
+
+# Turn a job into command line arguments: the positional settings in order, then "--name value"
+# for the rest, with true/false settings as flags
+def jobArgv(job, positional):
+    argv = [str(job[k]) for k in positional if k in job]
+    for k, v in job.items():
+        if(k in positional):
+            continue
+        if(isinstance(v, bool) or str(v).lower() in ("true", "false", "yes", "no")):
+            if(v is True or str(v).lower() in ("true", "yes")):
+                argv.append("--"+k)
+        else:
+            argv += ["--"+k, str(v)]
+    return argv
+
+
+# ---- Timing
+
+# Add the time spent in the with block to times[stage]
+@contextmanager
+def timeStage(times, stage):
+    _t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        times[stage] = times.get(stage, 0.0) + (time.perf_counter() - _t0)
+
+# Pass on the blocks from a generator, adding the time spent making them to times[stage]
+def timedBlocks(blocks, times, stage):
+    blocks = iter(blocks)
+    while True:
+        with timeStage(times, stage):
+            try:
+                b = next(blocks)
+            except StopIteration:
+                return
+        yield b
+
+
+# ---- Sharing things between jobs
+
+# Something (e.g. the images of a field) shared by several jobs, made by the first job that needs
+# it and forgotten once the last has finished with it.
+#   counts: how many jobs will use each key
+#   Returns get(key, make), which returns the thing and whether it had already been made, and
+#   release(key), for when a job has finished with it.
+def sharedItems(counts):
+    items = {}
+    locks = {k: threading.Lock() for k in counts}
+    left = dict(counts)
+    _lock = threading.Lock()
+
+    def get(key, make):
+        with locks[key]:
+            if(key in items):
+                return items[key], True
+            items[key] = make()
+            return items[key], False
+
+    def release(key):
+        with _lock:
+            left[key] -= 1
+            if(left[key] == 0):
+                items.pop(key, None)
+
+    return get, release
+
+
+# ---- Running the jobs
+
+# Run every job on a pool of threads.
+#   runJob(i, job, times) does job number i, adding the time spent on each stage to times
+#   Returns a result dictionary for each job (in the same order as the jobs)
+def runBatch(jobs, runJob, numWorkers=1):
+
+    def _run(i):
+        times = {}
+        res = {"job": i, "ok": True, "error": None, "seconds": times}
+        _t0 = time.perf_counter()
+        try:
+            runJob(i, jobs[i], times)
+        except Exception as e:
+            res["ok"] = False
+            res["error"] = type(e).__name__+": "+str(e)
+        res["totalSeconds"] = time.perf_counter() - _t0
+        print("  Job "+str(i+1)+" of "+str(len(jobs))+(" done" if res["ok"] else " failed: "+res["error"]))
+        return res
+
+    with ThreadPoolExecutor(max_workers=numWorkers) as pool:
+        return list(pool.map(_run, range(0, len(jobs))))
+
+# Summary of a batch run: overall and per stage times, and the results of each job
+def batchSummary(jobs, results, wallSeconds, numWorkers):
+    stages = {}
+    for r in results:
+        for s, t in r["seconds"].items():
+            stages[s] = stages.get(s, 0.0) + t
+    order = [s for s in STAGES if s in stages] + sorted(s for s in stages if s not in STAGES)
+
+    return {
+        "jobs": len(jobs),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "workers": numWorkers,
+        "wallSeconds": wallSeconds,
+        "stageSeconds": {s: stages[s] for s in order},
+        "results": [dict(r, settings=jobs[r["job"]]) for r in results]
+    }
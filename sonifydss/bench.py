@@ -0,0 +1,395 @@
+"""
+Benchmarks for the stages of a sonification, on made-up DSS-like images (so no SkyView needed):
+
+    python -m sonifydss.bench [-o results.json] [--full] [--compare baseline.json]
+
+Each case (row2sound, the three sweeps, writeSound and makeMovie) is run for every combination
+of image size, duration, sample rate and mono/stereo, each in a fresh interpreter so that its
+peak memory use (RSS) is its own. The quickest of a few repeats is kept, along with the samples
+of sound made per second. Everything is written to a JSON file, and --compare checks the results
+against an earlier file, flagging anything that has got slower (or bigger) by more than the
+tolerance. Any extra sound settings (e.g. "-e ifft") can be passed on with --options.
+
+With --precision the sweeps are also generated in both double and single precision (--dtype),
+to see how much quicker single precision is and how far its sound is from double precision's.
+With --drift the phasor oscillators (--oscillator phasor) are run on for an hour (or however long
+is given), and the furthest their phases have wandered is checked against PHASOR_DRIFT_BOUND.
+With --ifft the sweeps are generated by both engines (--engine sine and ifft) with the same phases,
+and how far apart they are is checked against sonifydss.ifft.ifftErrorBound(), and both against
+IFFT_MAX_ERROR_DB and IFFT_MAX_BOUND_DB below the peak.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# The cases, and the settings they are run with by default and with --full
+CASES = ["row2sound", "left2rightSweep", "top2bottomSweep", "radialSweep", "writeSound", "makeMovie"]
+QUICK_MATRIX = {"sizes": [128, 512], "durations": [5.0], "rates": [22050], "channels": ["stereo"]}
+FULL_MATRIX = {"sizes": [128, 256, 512, 1024, 2048], "durations": [5.0, 30.0], "rates": [22050, 44100],
+               "channels": ["mono", "stereo"]}
+
+# The cases compared in single and double precision with --precision (and by both engines with --ifft)
+PRECISION_CASES = ["left2rightSweep", "top2bottomSweep", "radialSweep"]
+
+# Most the phases of the phasor oscillators may wander (in radians) in a --drift check. A phase
+# error this size changes each partial by at most this fraction of its amplitude, far less than
+# one step of the 16 bit output.
+PHASOR_DRIFT_BOUND = 1e-6
+DRIFT_PARTIALS = 512
+
+# How far below the peak of each channel (in dB) an --ifft check needs the largest difference
+# between the engines, and ifftErrorBound(), to be. Only sweeps with at least as many samples a
+# pixel as between ifft frames are held to these (the ifft engine warns about the others, and only
+# the bound itself is checked for them). The bound adds up the worst case of every partial, so it
+# is usually 5-15dB above the difference.
+IFFT_MAX_ERROR_DB = -15.0
+IFFT_MAX_BOUND_DB = -10.0
+
+# How many times each case is run (keeping the quickest), and how much slower (as a fraction)
+# counts as a regression
+BENCH_REPEATS = 3
+BENCH_TOLERANCE = 0.25
+
+
+# ---- Made-up data
+
+# A square image that looks roughly like (median subtracted) DSS data: a noisy sky with stars of
+# all brightnesses and a fuzzy galaxy in the middle
+def syntheticImage(size, seed=0):
+    rng = np.random.default_rng(seed)
+    x, y = np.mgrid[0:size, 0:size]
+    img = rng.normal(5000.0, 150.0, (size, size))
+
+    _c = size / 2
+    img += 8000.0 * np.exp(-(((x-_c)/(0.15*size))**2 + ((y-_c)/(0.08*size))**2))
+
+    for _ in range(0, max(1, size*size // 2000)):
+        _x, _y = rng.uniform(0, size, 2)
+        _w = rng.uniform(0.7, 2.5)
+        _x0, _x1 = max(0, int(_x - 4*_w)), min(size, int(_x + 4*_w) + 1)
+        _y0, _y1 = max(0, int(_y - 4*_w)), min(size, int(_y + 4*_w) + 1)
+        img[_x0:_x1, _y0:_y1] += rng.pareto(1.5) * 2000.0 * np.exp(
+            -((x[_x0:_x1, _y0:_y1]-_x)**2 + (y[_x0:_x1, _y0:_y1]-_y)**2) / (2*_w*_w))
+
+    # The DSS data are 16 bit, and get median subtracted as in getDSSdata()
+    img = np.clip(img, 0, 32767).astype(np.int16)
+    return (img - np.median(img)).clip(0.0)
+
+# The sound parameters for a case, as the command line would make them
+def benchParameters(duration, rate, options, filename):
+    from sonifydss.cli import makeParser, makeParameters
+    args = makeParser().parse_args(["bench", "1", filename, str(duration), "-s", str(rate)] + shlex.split(options))
+    _, sndpars = makeParameters(args)
+    return sndpars
+
+
+# ---- Running the cases
+
+# Run one case in this interpreter: the quickest time (seconds) of the repeats
+def runCase(case, size, duration, rate, channels, options="", repeats=BENCH_REPEATS, tmpdir="."):
+    from sonifydss import sweeps
+    from sonifydss import output
+
+    # Mono is one image in its own channel, stereo two images left and right
+    imgs = [syntheticImage(size, 1), syntheticImage(size, 2)]
+    sndpars = benchParameters(duration, rate, options, os.path.join(tmpdir, "bench.wav"))
+    if(channels == "mono"):
+        imgs = imgs[:1]
+        sndpars["layout"] = "surveys"
+
+    if(case == "row2sound"):
+        run = lambda: sweeps.row2sound(np.stack([img[size//2] for img in imgs]), 440.0, 0.0, sndpars)
+    elif(case in ("left2rightSweep", "top2bottomSweep", "radialSweep")):
+        _f = getattr(sweeps, case)
+        run = lambda: _f(imgs, sndpars)
+    elif(case == "writeSound"):
+        sound = np.random.default_rng(3).normal(0.0, 1.0, (len(imgs), sndpars["soundLenSam"]))
+        run = lambda: output.writeSound(sound, sndpars)
+    elif(case == "makeMovie"):
+        from sonifydss.pictures import DSS2RGB, makeMovie
+        imgL, imgR = syntheticImage(size, 1), syntheticImage(size, 2)
+        sound = np.random.default_rng(3).normal(0.0, 1.0, (2, sndpars["soundLenSam"]))
+        output.writeSound(sound, sndpars)
+        imgRGB = DSS2RGB(imgL, imgR)
+        sndpars["sweepDirn"] = "LR"
+        run = lambda: makeMovie(imgRGB, sndpars, os.path.join(tmpdir, "bench.mp4"), sndpars["filename"])
+    else:
+        raise ValueError("Unknown benchmark case: "+case)
+
+    best = None
+    for _ in range(0, repeats):
+        _t0 = time.perf_counter()
+        run()
+        _t = time.perf_counter() - _t0
+        best = _t if best is None else min(best, _t)
+    return best
+
+# Generate the same sweep (same phases) in double and single precision.
+#   Returns the quickest time (seconds) of each and how far the single precision sound is from
+#   the double precision one: the largest difference as a fraction of the peak and in steps of
+#   the 16 bit output, and the signal to noise ratio (dB)
+def comparePrecision(case, size, duration, rate, options="", repeats=BENCH_REPEATS):
+    from sonifydss import sweeps
+    from sonifydss.synth import sweepSynth
+
+    imgL = syntheticImage(size, 1)
+    imgR = syntheticImage(size, 2)
+    sndpars = benchParameters(duration, rate, options+" -dt float64", "bench.wav")
+    partials = getattr(sweeps, case.replace("Sweep", "Partials"))([imgL, imgR], sndpars)
+
+    res = {}
+    sounds = {}
+    for dt in ("float64", "float32"):
+        sndpars["dtype"] = dt
+        best = None
+        for _ in range(0, repeats):
+            _t0 = time.perf_counter()
+            sounds[dt] = sweepSynth(*partials, sndpars, progress=False)
+            _t = time.perf_counter() - _t0
+            best = _t if best is None else min(best, _t)
+        res["seconds"+dt[-2:]] = best
+
+    ref = sounds["float64"]
+    diff = sounds["float32"] - ref
+    _peak = np.amax(np.abs(ref))
+    res["gain"] = res["seconds64"] / res["seconds32"]
+    res["maxDeviation"] = float(np.amax(np.abs(diff)) / _peak)
+    res["maxDeviationLSB"] = res["maxDeviation"] * 2**15
+    res["snrDB"] = float(10 * np.log10(np.mean(ref**2) / max(np.mean(diff**2), 1e-300)))
+    return res
+
+# How far the phases of the phasor oscillators wander over a sound of the given length (in
+# seconds), for partials covering the default frequency range at each of the given sample rates
+# and the largest and smallest blocks synthBlocks() makes
+def checkDrift(seconds, rates, options=""):
+    from sonifydss.synth import partialFreqs, phasorDrift, BLOCK_SAMPLES, MIN_BLOCK_SAMPLES
+
+    res = []
+    for rate in rates:
+        sndpars = benchParameters(seconds, rate, options, "bench.wav")
+        freqs = partialFreqs(DRIFT_PARTIALS, sndpars)
+        for blkLen in (BLOCK_SAMPLES, MIN_BLOCK_SAMPLES):
+            _t0 = time.perf_counter()
+            drift = phasorDrift(freqs, seconds, blkLen, sndpars)
+            res.append({"duration": seconds, "rate": rate, "blockSamples": blkLen, "driftRadians": drift,
+                        "ok": drift <= PHASOR_DRIFT_BOUND, "seconds": time.perf_counter() - _t0})
+    return res
+
+# How far the ifft engine's sound is from the sine engine's for each sweep (same rows, frequencies
+# and phases, in double precision), against the bound ifftErrorBound() gives for each channel, and
+# both as dB below the peak of the channel against IFFT_MAX_ERROR_DB and IFFT_MAX_BOUND_DB
+def checkIfft(cases, sizes, durations, rates, options=""):
+    from sonifydss import sweeps
+    from sonifydss.synth import sweepSynth
+    from sonifydss.ifft import ifftErrorBound, ifftTooCoarse
+
+    res = []
+    imgs = {}
+    for case in cases:
+        for size in sizes:
+            if(size not in imgs):
+                imgs[size] = [syntheticImage(size, 1), syntheticImage(size, 2)]
+            for duration in durations:
+                for rate in rates:
+                    sndpars = benchParameters(duration, rate, options+" -dt float64 -lay surveys", "bench.wav")
+                    rows, freqs, phs = getattr(sweeps, case.replace("Sweep", "Partials"))(imgs[size], sndpars)
+                    sounds = {}
+                    for engine in ("sine", "ifft"):
+                        sounds[engine] = sweepSynth(rows, freqs, phs, dict(sndpars, engine=engine, workers=1), progress=False)
+                    diff = np.amax(np.abs(sounds["ifft"] - sounds["sine"]), axis=1)
+                    bound = ifftErrorBound(np.asarray(rows), freqs, sndpars)
+                    peak = np.amax(np.abs(sounds["sine"]), axis=1)
+                    diffDB = 20*np.log10(diff / peak)
+                    boundDB = 20*np.log10(bound / peak)
+                    coarse = ifftTooCoarse(rows.shape[2], sndpars)
+                    ok = np.all(diff <= bound) and (coarse or (np.all(diffDB <= IFFT_MAX_ERROR_DB) and np.all(boundDB <= IFFT_MAX_BOUND_DB)))
+                    res.append({"case": case, "size": size, "duration": duration, "rate": rate, "channels": "stereo",
+                                "maxDifference": diff.tolist(), "bound": bound.tolist(), "peak": peak.tolist(),
+                                "maxDifferenceDB": diffDB.tolist(), "boundDB": boundDB.tolist(), "coarse": coarse, "ok": bool(ok)})
+    return res
+
+# Peak RSS of this process so far, in MB
+def peakRSS():
+    import resource
+    _r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return _r / (1024*1024) if sys.platform == "darwin" else _r / 1024
+
+# Run one case in a fresh interpreter, returning its result
+def runIsolated(spec):
+    # Make sure the child finds this copy of sonifydss, wherever it is run from
+    env = dict(os.environ)
+    _pkg = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join([_pkg] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else []))
+    _out = subprocess.run([sys.executable, "-m", "sonifydss.bench", "--one", json.dumps(spec)],
+                          capture_output=True, text=True, env=env)
+    lines = _out.stdout.strip().splitlines()
+    if(_out.returncode != 0 or len(lines) == 0):
+        _err = _out.stderr.strip().splitlines()
+        return dict(spec, error=_err[-1] if _err else "exit status "+str(_out.returncode))
+    return json.loads(lines[-1])
+
+# What --one does: run the case and print the result as JSON
+def _runOne(spec):
+    res = dict(spec)
+    if(spec.get("precision")):
+        res.update(comparePrecision(spec["case"], spec["size"], spec["duration"], spec["rate"],
+                                    spec["options"], spec["repeats"]))
+        print(json.dumps(res))
+        return
+    with tempfile.TemporaryDirectory() as tmpdir:
+        _before = peakRSS()
+        try:
+            _t = runCase(spec["case"], spec["size"], spec["duration"], spec["rate"], spec["channels"],
+                         spec["options"], spec["repeats"], tmpdir)
+        except (ImportError, FileNotFoundError) as e:
+            # Missing matplotlib, ffmpeg, ...
+            res["skipped"] = type(e).__name__+": "+str(e)
+            print(json.dumps(res))
+            return
+    lenSam = int(spec["duration"] * spec["rate"])
+    res["seconds"] = _t
+    res["samplesPerSec"] = lenSam / _t if _t > 0 else None
+    res["peakRSSMB"] = peakRSS()
+    res["caseRSSMB"] = res["peakRSSMB"] - _before
+    print(json.dumps(res))
+
+# Every combination of the cases and settings
+def benchSpecs(cases, matrix, options="", repeats=BENCH_REPEATS):
+    return [{"case": c, "size": s, "duration": d, "rate": r, "channels": ch, "options": options, "repeats": repeats}
+            for c in cases for s in matrix["sizes"] for d in matrix["durations"]
+            for r in matrix["rates"] for ch in matrix["channels"]]
+
+# What the results were run on
+def benchMeta():
+    return {"date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+
+# ---- Comparing with a baseline
+
+# The settings that identify a result
+def resultKey(res):
+    return (res["case"], res["size"], res["duration"], res["rate"], res["channels"], res.get("options", ""))
+
+# Results that are slower (or use more memory) than the baseline by more than the tolerance.
+#   Returns (result, baseline result, what got worse, ratio) for each
+def compareResults(results, baseline, tolerance=BENCH_TOLERANCE):
+    base = {resultKey(b): b for b in baseline}
+    worse = []
+    for r in results:
+        b = base.get(resultKey(r))
+        if(b is None or "seconds" not in r or "seconds" not in b):
+            continue
+        for k in ("seconds", "caseRSSMB"):
+            # Ignore memory differences of less than a few MB
+            if(k == "caseRSSMB" and r[k] - b[k] < 4.0):
+                continue
+            if(b[k] > 0 and r[k] > b[k] * (1.0 + tolerance)):
+                worse.append((r, b, k, r[k] / b[k]))
+    return worse
+
+
+# ---- Command line
+
+def _describe(r):
+    return "{case:16s} {size:5d}px {duration:6.1f}s {rate:6d}Hz {channels:6s}".format(**r)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m sonifydss.bench', description='Benchmark the stages of a sonification.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-o', '--output', nargs='?', default='bench.json', help='The JSON file to write the results to')
+    parser.add_argument('-c', '--cases', nargs='+', default=[c for c in CASES if c != "makeMovie"], choices=CASES, help='The cases to run')
+    parser.add_argument('--full', action='store_true', help='Run the full matrix of sizes, durations, rates and channels, rather than a quick one')
+    parser.add_argument('--sizes', nargs='+', type=int, help='The image sizes (in pixels)')
+    parser.add_argument('--durations', nargs='+', type=float, help='The sound durations (in seconds)')
+    parser.add_argument('--rates', nargs='+', type=int, help='The sample rates (in Hz)')
+    parser.add_argument('--channels', nargs='+', choices=['mono', 'stereo'], help='Mono and/or stereo')
+    parser.add_argument('-r', '--repeats', nargs='?', type=int, default=BENCH_REPEATS, help='How many times to run each case (the quickest is kept)')
+    parser.add_argument('--options', nargs='?', default='', help='Any other sound settings, as on the command line (e.g. "-e ifft")')
+    parser.add_argument('--precision', action='store_true', help='Also compare generating the sweeps in single and double precision')
+    parser.add_argument('--drift', nargs='?', type=float, const=3600.0, default=None, help='Check how far the phases of the phasor oscillators wander over a sound this long (in seconds, default an hour)')
+    parser.add_argument('--ifft', action='store_true', help='Check that the ifft engine is no further from the sine engine than ifftErrorBound() says')
+    parser.add_argument('--compare', nargs='?', default=None, help='A results file to compare against')
+    parser.add_argument('--tolerance', nargs='?', type=float, default=BENCH_TOLERANCE, help='How much slower (as a fraction) counts as a regression')
+    parser.add_argument('--one', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if(args.one):
+        _runOne(json.loads(args.one))
+        return 0
+
+    matrix = dict(FULL_MATRIX if args.full else QUICK_MATRIX)
+    for k in ("sizes", "durations", "rates", "channels"):
+        if(getattr(args, k)):
+            matrix[k] = getattr(args, k)
+
+    results = []
+    specs = benchSpecs(args.cases, matrix, args.options, max(1, args.repeats))
+    for i, spec in enumerate(specs):
+        r = runIsolated(spec)
+        results.append(r)
+        if("seconds" in r):
+            print("  {}  {:9.3f}s {:12.0f} samples/s {:8.1f}MB".format(_describe(r), r["seconds"], r["samplesPerSec"], r["caseRSSMB"]))
+        else:
+            print("  {}  {}".format(_describe(r), r.get("skipped", r.get("error"))))
+
+    precision = []
+    if(args.precision):
+        print("Single against double precision:")
+        _m = dict(matrix, channels=["stereo"])
+        for spec in benchSpecs(PRECISION_CASES, _m, args.options, max(1, args.repeats)):
+            r = runIsolated(dict(spec, precision=True))
+            precision.append(r)
+            if("gain" in r):
+                print("  {}  {:8.3f}s -> {:8.3f}s (x{:.2f})  deviation {:.1e} of peak, {:.2f} LSB, SNR {:.0f}dB".format(
+                    _describe(r), r["seconds64"], r["seconds32"], r["gain"], r["maxDeviation"], r["maxDeviationLSB"], r["snrDB"]))
+            else:
+                print("  {}  {}".format(_describe(r), r.get("error")))
+
+    drift = []
+    if(args.drift):
+        print("Phasor oscillator drift over {:.0f}s (bound {:.0e} radians):".format(args.drift, PHASOR_DRIFT_BOUND))
+        drift = checkDrift(args.drift, matrix["rates"], args.options)
+        for r in drift:
+            print("  {rate:6d}Hz {blockSamples:5d} sample blocks  {driftRadians:.1e} radians".format(**r)+("" if r["ok"] else "  TOO MUCH"))
+
+    ifft = []
+    if(args.ifft):
+        print("ifft engine against the sine engine (largest difference, and its bound, for each channel in dB below its peak;"
+              " at most {:.0f}dB and {:.0f}dB):".format(IFFT_MAX_ERROR_DB, IFFT_MAX_BOUND_DB))
+        ifft = checkIfft(PRECISION_CASES, matrix["sizes"], matrix["durations"], matrix["rates"], args.options)
+        for r in ifft:
+            print("  {}  {}  bound {}".format(_describe(r), " ".join("{:6.1f}dB".format(d) for d in r["maxDifferenceDB"]),
+                                              " ".join("{:6.1f}dB".format(b) for b in r["boundDB"]))
+                  +("  (too few samples a pixel)" if r["coarse"] else "")+("" if r["ok"] else "  TOO FAR"))
+
+    with open(args.output, "w") as f:
+        json.dump({"meta": benchMeta(), "results": results, "precision": precision, "drift": drift, "ifft": ifft}, f, indent=2)
+    print("Written results to "+args.output)
+
+    # Report everything that went wrong before saying so
+    failed = any(not r["ok"] for r in drift + ifft)
+    if(args.compare):
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        worse = compareResults(results, baseline, args.tolerance)
+        for r, b, k, ratio in worse:
+            print("  REGRESSION {}  {} {:.3f} -> {:.3f} ({:+.0f}%)".format(_describe(r), k, b[k], r[k], 100*(ratio-1)))
+        print(str(len(worse))+" regressions against "+args.compare)
+        failed = failed or len(worse) > 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+A local on-disk cache of DSS images, and of the sounds made from them.
+
+Each image downloaded from SkyView is stored as a FITS file named after a hash of everything
+that determines it: the (resolved) sky position, the survey, the number of pixels, the radius
+and the scaling. Object names are resolved to positions once and remembered, so that "M51" and
+"m 51" share images and so that names can be looked up without a network connection. Using a
+file refreshes its modification time, and once the cache is over its size limit the least
+recently used files are removed.
+
+Sounds made with a seed (sndpars["seed"]) come out the same every time, so they are kept too,
+unscaled, as .npy files named after a hash of the images and every sound parameter that changes
+the sound (not the output file, its sample format, the output gain or the movie settings).
+Writing the same sound to another file or format, or making the movie again, then reads it back
+instead of generating it. Renders are evicted by size separately from the images.
+"""
+
+import hashlib
+import json
+import os
+import glob
+import tempfile
+import threading
+
+import numpy as np
+
+# Where the cache lives unless told otherwise, and its default size limits (in MB) for images and sounds
+DEFAULT_CACHE_DIR = os.environ.get("SONIFYDSS_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "sonifydss"))
+DEFAULT_CACHE_MB = 1024
+DEFAULT_RENDER_MB = 1024
+
+# File that remembers the positions of object names, and a lock for updating it
+_NAMES_FILE = "names.json"
+_namesLock = threading.Lock()
+
+# The sound parameters that only change how a sound is written (or shown), or how quickly it is
+# made (any number of workers gives the same sound), not the sound itself, and a version number to
+# change whenever the same parameters start to give a different sound
+RENDER_OUTPUT_PARAMETERS = ["filename", "sampleFormat", "gainDb", "movieFps", "movieDpi", "movieWorkers", "workers"]
+RENDER_VERSION = 1
+
+
+# ---- Generic bits, shared by anything that keeps files in the cache
+
+# A content-addressed key for a dictionary of the things that determine a cached file
+def cacheKey(fields):
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+# The path of a cached file (which may not exist yet)
+def cachePath(cachedir, key, ext):
+    return os.path.join(cachedir, key + ext)
+
+# Mark a cached file as just used, returning whether it is there at all
+def cacheTouch(path):
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+# Write a file into the cache. The writer is given a temporary path in the cache directory which
+# is then renamed into place, so nobody ever sees a half written file.
+def cacheStore(cachedir, path, writer):
+    os.makedirs(cachedir, exist_ok=True)
+    _fd, _tmp = tempfile.mkstemp(dir=cachedir, suffix=".part")
+    os.close(_fd)
+    try:
+        writer(_tmp)
+        os.replace(_tmp, path)
+    finally:
+        if(os.path.exists(_tmp)):
+            os.remove(_tmp)
+
+# Remove the least recently used files matching the pattern until they fit in maxBytes
+def cacheEvict(cachedir, maxBytes, pattern):
+    files = []
+    for f in glob.glob(os.path.join(cachedir, pattern)):
+        try:
+            st = os.stat(f)
+        except FileNotFoundError:
+            continue
+        files.append((st.st_mtime, st.st_size, f))
+
+    total = sum(f[1] for f in files)
+    for _, size, f in sorted(files):
+        if(total <= maxBytes):
+            break
+        try:
+            os.remove(f)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+# ---- Positions
+
+# Resolve an object name or coordinates to (RA, Dec) in degrees.
+#   Coordinates are used as they are, names are looked up (and remembered in the cache)
+#   unless offline, when only remembered names can be used.
+def resolvePosition(objcoo, cachedir, offline=False):
+    from astropy import units as u
+    from astropy.coordinates import SkyCoord
+    try:
+        _c = SkyCoord(objcoo, unit=(u.hourangle, u.deg))
+        return (round(float(_c.ra.deg), 6), round(float(_c.dec.deg), 6))
+    except (ValueError, u.UnitsError):
+        pass
+
+    _name = " ".join(objcoo.upper().split())
+    _namefile = os.path.join(cachedir, _NAMES_FILE)
+    names = _readNames(_namefile)
+    if(_name in names):
+        return tuple(names[_name])
+
+    if(offline):
+        raise LookupError("The position of "+objcoo+" is not in the cache at "+cachedir+" (working offline)")
+
+    _c = SkyCoord.from_name(objcoo)
+    radec = (round(float(_c.ra.deg), 6), round(float(_c.dec.deg), 6))
+
+    # Other threads may have added names since, so re-read before adding this one
+    with _namesLock:
+        names = _readNames(_namefile)
+        names[_name] = list(radec)
+        def _write(p):
+            with open(p, "w") as f:
+                json.dump(names, f)
+        cacheStore(cachedir, _namefile, _write)
+    return radec
+
+# The remembered positions of object names
+def _readNames(namefile):
+    try:
+        with open(namefile) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+# ---- DSS images
+
+# The cache file for one survey image
+def fitsCachePath(cachedir, radec, survey, angsize, imgpars):
+    key = cacheKey({"ra": radec[0], "dec": radec[1], "survey": survey,
+                    "pixels": imgpars["pixelSize"], "radius": angsize/2.0, "scaling": imgpars["scaling"]})
+    return cachePath(cachedir, key, ".fits")
+
+# Get a survey image from the cache, or None if it is not there
+def fitsCacheGet(path):
+    if(not cacheTouch(path)):
+        return None
+    from astropy.io import fits
+    return fits.open(path, memmap=False)
+
+# Put a survey image (HDUList) in the cache, then trim the cache to size
+def fitsCachePut(path, hdul, cachedir, maxMB):
+    cacheStore(cachedir, path, lambda p: hdul.writeto(p, overwrite=True))
+    cacheEvict(cachedir, maxMB * 1024 * 1024, "*.fits")
+
+
+# ---- Rendered sounds
+
+# A digest of an image's pixels or, for a memory mapped FITS file (see sonifydss.mapped), of the
+# file itself (its name, size and modification time), which would take a long time to read
+def imageDigest(img):
+    if(hasattr(img, "filename")):
+        st = os.stat(img.filename)
+        return cacheKey({"file": os.path.abspath(img.filename), "size": st.st_size,
+                         "mtime": st.st_mtime_ns, "median": img.median})
+    img = np.ascontiguousarray(img)
+    h = hashlib.sha256(json.dumps([img.shape, img.dtype.str]).encode())
+    h.update(img.data)
+    return h.hexdigest()
+
+# The cache file for the sound made from the given images with the given sound parameters
+def renderCachePath(cachedir, imgs, sndpars):
+    key = cacheKey({"images": [imageDigest(img) for img in imgs], "version": RENDER_VERSION,
+                    "sound": {k: v for k, v in sndpars.items() if k not in RENDER_OUTPUT_PARAMETERS}})
+    return cachePath(cachedir, key, ".npy")
+
+# Get a rendered sound (channels, samples) from the cache, memory mapped, or None if it is not there
+def renderCacheGet(path):
+    if(not cacheTouch(path)):
+        return None
+    return np.load(path, mmap_mode="r")
+
+# Put a rendered sound in the cache, then trim the renders to size
+def renderCachePut(path, sound, cachedir, maxMB):
+    if(sound.nbytes > maxMB * 1024 * 1024):
+        return
+    def _write(p):
+        with open(p, "wb") as f:
+            np.save(f, sound)
+    cacheStore(cachedir, path, _write)
+    cacheEvict(cachedir, maxMB * 1024 * 1024, "*.npy")
+
+# Pass (first sample, block) pairs of a sound of the given (channels, samples) shape through,
+# putting them in the cache (as renderCachePut does) once they have all gone by
+def renderCacheBlocks(blocks, path, shape, dtype, cachedir, maxMB):
+    if(shape[0] * shape[1] * np.dtype(dtype).itemsize > maxMB * 1024 * 1024):
+        yield from blocks
+        return
+    os.makedirs(cachedir, exist_ok=True)
+    _fd, _tmp = tempfile.mkstemp(dir=cachedir, suffix=".part")
+    os.close(_fd)
+    try:
+        out = np.lib.format.open_memmap(_tmp, mode="w+", dtype=dtype, shape=shape)
+        for s, block in blocks:
+            out[:, s:s+block.shape[1]] = block
+            yield s, block
+        out.flush()
+        del out
+        os.replace(_tmp, path)
+    finally:
+        if(os.path.exists(_tmp)):
+            os.remove(_tmp)
+    cacheEvict(cachedir, maxMB * 1024 * 1024, "*.npy")
@@ -0,0 +1,109 @@
+"""
+Which output channels the images (one for each survey) are heard in (sndpars["layout"]).
+
+The sound is generated with one channel for each image, all of them stacked together (channels x
+partials x samples) however many there are, and each block of it is then mixed to the output
+channels with a single (output channels, images) matrix:
+
+  * "stereo" (the default): the images spread from left to right with equal power panning, so
+    two images are the left and right channels just as they are, and one image is in both
+  * "mono": all of the images in one channel
+  * "surveys": a channel for each image, just as it is
+  * "ambisonic": first order Ambisonics (AmbiX: channels W, Y, Z, X with SN3D normalisation) with
+    the images spread across the front from left to right, to be decoded for any set of speakers
+
+    mat = channelMatrix(3, "stereo")     # (2, 3)
+    block = mixChannels(block, mat)      # (3, samples) -> (2, samples)
+
+With sndpars["pan"] the partials are placed in the output channels themselves instead (see
+sonifydss.panning), so there is nothing left to mix.
+"""
+
+import numpy as np
+
+# The ways the images can be mixed to the output channels
+CHANNEL_LAYOUTS = ["stereo", "mono", "surveys", "ambisonic"]
+
+
+# The direction of each of numImgs images spread across the front from left to right, in radians
+# anticlockwise from straight ahead (so left is positive)
+def imageAzimuths(numImgs):
+    if(numImgs == 1):
+        return np.zeros(1)
+    return np.linspace(np.pi/2, -np.pi/2, numImgs)
+
+# The gains (output channels, *az.shape) that put sounds at azimuths az (in radians, as
+# imageAzimuths()) in a layout. Stereo only has left and right, so anything behind is put where
+# it would be in front.
+def directionGains(az, layout="stereo"):
+    az = np.asarray(az, float)
+    if(layout == "mono"):
+        return np.ones((1,) + az.shape)
+    if(layout == "stereo"):
+        _a = np.pi/4 - np.where(np.abs(az) > np.pi/2, np.copysign(np.pi, az) - az, az)/2
+        gains = np.stack((np.cos(_a), np.sin(_a)))
+    elif(layout == "ambisonic"):
+        gains = np.stack((np.ones(az.shape), np.sin(az), np.zeros(az.shape), np.cos(az)))
+    else:
+        raise ValueError("Sounds cannot be placed by direction in the "+str(layout)+" layout")
+    # So that sounds hard left or right (or straight ahead) are not in the other channels at all
+    gains[np.abs(gains) < 1e-12] = 0.0
+    return gains
+
+# The (output channels, images) matrix that mixes numImgs images to the channels of a layout
+def channelMatrix(numImgs, layout="stereo"):
+    if(layout not in CHANNEL_LAYOUTS):
+        raise ValueError("Unknown channel layout: "+str(layout)+" (can be "+", ".join(CHANNEL_LAYOUTS)+")")
+    if(layout == "surveys"):
+        return np.eye(numImgs)
+    if(layout == "stereo" and numImgs == 1):
+        return np.ones((2, 1))
+    return directionGains(imageAzimuths(numImgs), layout)
+
+# The number of output channels for numImgs images with the layout in the sound parameters
+def outputChannels(numImgs, sndpars):
+    if(sndpars.get("pan")):
+        return directionGains(0.0, sndpars.get("layout", "stereo")).shape[0]
+    return channelMatrix(numImgs, sndpars.get("layout", "stereo")).shape[0]
+
+# The matrix to mix numImgs images with, or None if they are the output channels just as they are
+# (or the partials have already been placed in them, see sonifydss.panning)
+def channelMix(numImgs, sndpars):
+    if(sndpars.get("pan")):
+        return None
+    mat = channelMatrix(numImgs, sndpars.get("layout", "stereo"))
+    if(mat.shape[0] == numImgs and np.array_equal(mat, np.eye(numImgs))):
+        return None
+    return mat
+
+# A block (images, samples) mixed to the output channels (channels, samples)
+def mixChannels(block, mat):
+    if(mat is None):
+        return block
+    return mat.astype(block.dtype, copy=False) @ block
+
+# Blocks of sound as (first sample, block) pairs, mixed to the output channels
+def mixBlocks(blocks, mat):
+    if(mat is None):
+        return blocks
+    return ((s, mixChannels(block, mat)) for s, block in blocks)
+
+# What each image is in a layout, e.g. "Left channel" (for pictures)
+def imageRoles(numImgs, layout="stereo", pan=False):
+    if(pan):
+        return ["Panned by position"] * numImgs
+    if(layout == "surveys"):
+        return ["Channel "+str(k+1) for k in range(0, numImgs)]
+    if(layout == "mono"):
+        return ["Mono"] * numImgs
+    if(layout == "stereo" and numImgs == 1):
+        return ["Both channels"]
+    roles = []
+    for _a in np.degrees(imageAzimuths(numImgs)):
+        if(layout == "stereo" and abs(_a) == 90):
+            roles.append("Left channel" if _a > 0 else "Right channel")
+        elif(abs(_a) < 1e-9):
+            roles.append("Centre")
+        else:
+            roles.append(str(int(round(abs(_a))))+" degrees "+("left" if _a > 0 else "right"))
+    return roles
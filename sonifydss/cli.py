@@ -0,0 +1,480 @@
+"""
+The command line: sonify one field, prefetch DSS data for a list of targets, run a batch of jobs,
+or play a field live and control it.
+sonify-dss.py just calls main(); everything here can also be used from other code.
+"""
+
+import argparse
+import os
+import sys
+import json
+import time
+import threading
+
+from sonifydss.sonifier import Sonifier
+from sonifydss.cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MB, DEFAULT_RENDER_MB
+from sonifydss.fetch import readTargets, prefetchTargets, DEFAULT_SURVEYS
+from sonifydss.channels import CHANNEL_LAYOUTS
+from sonifydss.playback import formatReport
+from sonifydss.profiling import Profiler, formatProfile
+from sonifydss.batch import readManifest, jobArgv, timeStage, timedBlocks, sharedItems, runBatch, batchSummary
+
+
+# ======================================================================================================
+# ==== Command line and parameter set up
+
+# ---- The command line for a single sonification (without the output file for live sonification)
+def makeParser(prog=None, description='Sonify DSS images.', outfile=True):
+
+    parser = argparse.ArgumentParser(prog=prog, description=description, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
+    parser.add_argument('object', help='The astronomical object name or coordinates')
+    parser.add_argument('angsize', type=float, help='The angular size (in arcminutes)')
+    if outfile:
+        parser.add_argument('outfile', help='The output WAV file')
+    else:
+        parser.set_defaults(outfile=None)
+    parser.add_argument('soundlen', type=float, help='The duration of the sound (in seconds)')
+    parser.add_argument('-d', '--direction', nargs='?', type=str.lower, default='lr', choices=['lr','rl','tb','bt','clk','aclk'], help='The "sweep" direction: Left-to-right, Right-to-left, Top-to-bottom, Bottom-to-top, Clockwise, Anticlockwise')
+    parser.add_argument('-s', '--samplerate', nargs='?', type=int, default=44100, help='The sample rate (in Hz)')
+    parser.add_argument('-lf', '--lowfreq', nargs='?', type=float, default=30, help='The low frequency limit (in Hz)')
+    parser.add_argument('-hf', '--highfreq', nargs='?', type=float, default=2000, help='The high frequency limit (in Hz)')
+    parser.add_argument('-ff', '--flipfreq', action='store_true', help='Flip the frequency range order')
+    parser.add_argument('-ms', '--minsubtract', action='store_true', help='Subtract the lowest value from each pixel row')
+    parser.add_argument('-e', '--engine', nargs='?', type=str.lower, default='sine', choices=['sine','ifft'], help='The synthesis engine: a sum of sine waves, or inverse FFTs of short frames (much quicker for large images and long sounds)')
+    parser.add_argument('-bi', '--bilinear', action='store_true', help='Interpolate between pixels for the clockwise and anticlockwise sweeps, rather than using the nearest pixel')
+    parser.add_argument('-int', '--interp', nargs='?', type=str.lower, default='linear', choices=['linear','cubic','sinc'], help='How the loudness of each partial goes from one pixel to the next: a straight line, a smooth (Catmull-Rom) cubic curve, or a windowed (Lanczos) sinc')
+    parser.add_argument('-cr', '--controlrate', nargs='?', type=float, default=None, help='Work out the loudness of each partial this many times a second (in Hz, e.g. 1000) and go in a straight line in between, rather than at every sample (sine engine only) (default: every sample)')
+    parser.add_argument('-osc', '--oscillator', nargs='?', type=str.lower, default='sin', choices=['sin','phasor'], help='How the sine engine makes its sine waves: calling sin for every sample, or turning phasors (one complex multiply per sample)')
+    parser.add_argument('-dt', '--dtype', nargs='?', type=str.lower, default='float64', choices=['float64','float32'], help='The precision to generate the sound in: float32 is quicker and uses half the memory, and stays well below the noise of the 16 bit output')
+    parser.add_argument('-b', '--bands', nargs='?', type=int, default=None, help='The number of frequency bands (partials): neighbouring rows, columns or rings are combined into this many, so the sound takes as long to make however big the image (default: one for each row, column or ring)')
+    parser.add_argument('-agg', '--aggregate', nargs='?', type=str.lower, default='mean', choices=['mean','max','energy'], help='How the rows of each band are combined: their mean, maximum or energy (root mean square)')
+    parser.add_argument('-seed', '--seed', nargs='?', type=int, default=None, help='Start the random phases of the partials from this seed, so the same settings always give the same sound (which is then kept in the cache, so writing it again, e.g. to another format or with another gain, does not generate it again) (default: different every time)')
+    parser.add_argument('-w', '--workers', nargs='?', type=int, default=1, help='The number of processes to generate the sound with (sine engine only)')
+    parser.add_argument('-siz', '--imagesize', nargs='?', type=int, default=500, help='The DSS image size in pixels')
+
+    parser.add_argument('-cd', '--cachedir', nargs='?', default=DEFAULT_CACHE_DIR, help='The directory to keep downloaded DSS data in (or set SONIFYDSS_CACHE)')
+    parser.add_argument('-cs', '--cachesize', nargs='?', type=float, default=DEFAULT_CACHE_MB, help='The most DSS data to keep in the cache (in MB)')
+    parser.add_argument('-rcs', '--rendercachesize', nargs='?', type=float, default=DEFAULT_RENDER_MB, help='The most sound (made with --seed) to keep in the cache (in MB), or 0 to keep none (none is kept with --nocache either)')
+    parser.add_argument('-nc', '--nocache', action='store_true', help='Always get the DSS data from SkyView, and do not keep it (or any sound made with --seed: use -rcs 0 to only turn that off)')
+    parser.add_argument('-off', '--offline', action='store_true', help='Only use DSS data already in the cache')
+    parser.add_argument('-src', '--source', nargs='?', default=None, help='Where to get DSS data from if it is not in the cache: the URL of a SkyView-like server or a directory of FITS files (default: SkyView)')
+    parser.add_argument('-sv', '--surveys', nargs='+', metavar='SURVEY', default=DEFAULT_SURVEYS, help='The SkyView surveys to sonify, one image (and channel) for each, e.g. "DSS2 Red" "DSS2 IR" "DSS2 Blue"')
+    parser.add_argument('-fits', '--fitsfiles', nargs='+', metavar='FITSFILE', default=None, help='Sonify these local FITS files (one image for each, e.g. red then blue) instead of DSS data. They are memory mapped, so can be bigger than memory, and the object and angular size are just labels')
+    parser.add_argument('-lay', '--layout', nargs='?', type=str.lower, default='stereo', choices=CHANNEL_LAYOUTS, help='The output channels: the images spread from left to right in stereo, all in one mono channel, a channel for each image (surveys), or first order Ambisonics (ambisonic, AmbiX)')
+    parser.add_argument('-pan', '--pan', action='store_true', help='Place each partial by where its pixels are rather than each image: along the sweep line from left to right, or at the angle of the line for the clockwise and anticlockwise sweeps (stereo, mono or ambisonic layouts)')
+
+    parser.add_argument('-pic', '--picture', nargs=1, help='Make an image of DSS data and store it in the given file')
+    parser.add_argument('-mov', '--movie', nargs=1, help='Make a movie of the "sweep" and store it in the given file')
+    parser.add_argument('-mw', '--movie-workers', nargs='?', type=int, default=1, help='The number of processes to make the movie with')
+    parser.add_argument('-mfps', '--movie-fps', nargs='?', type=int, default=24, help='The frames per second of the movie')
+    parser.add_argument('-mdpi', '--movie-dpi', nargs='?', type=int, default=100, help='The resolution of the movie (in pixels per inch of an 8 inch square)')
+
+    parser.add_argument('-sf', '--sampleformat', nargs='?', default='16', choices=['16','24','float'], help='The samples of the output file: 16 or 24 bit integers or 32 bit floats (the file type comes from the output file name, e.g. .wav or .flac)')
+    parser.add_argument('-g', '--gain', nargs='?', type=float, default=0.0, help='The level of the loudest sample in the output file (in dB below full scale, so 0 or less)')
+    parser.add_argument('-p', '--play', action='store_true', help='Play the sound when finished')
+    parser.add_argument('-lp', '--liveplay', action='store_true', help='Play the sound while it is being generated (and write it as well), rather than when finished')
+    parser.add_argument('-dev', '--device', nargs='?', default=None, help='The audio device to play the sound on with --liveplay (a name or number), or "null" to play it to nowhere (default: the default device)')
+    parser.add_argument('-prof', '--profile', default=None, help='Time each stage (wall and CPU time, peak memory and samples per second), show them when finished and write them to this JSON file')
+    parser.add_argument('-trace', '--trace', default=None, help='Write the timings of every stage to this file as a Chrome trace (for chrome://tracing or ui.perfetto.dev)')
+    parser.add_argument('-st', '--stream', action='store_true', help='Write the sound out as it is generated, so memory use does not grow with its duration (uses some temporary disk space next to the output file)')
+
+    return parser
+
+# ---- Check the command line settings make sense together (raises ValueError if not)
+def checkArgs(args):
+
+    if args.lowfreq >= args.highfreq:
+        raise ValueError('The low frequency limit must be less than the high frequency limit')
+
+    if args.workers < 1:
+        raise ValueError('The number of workers must be at least 1')
+
+    if args.gain > 0:
+        raise ValueError('The gain cannot be above full scale (0dB)')
+
+    if args.bands is not None and args.bands < 1:
+        raise ValueError('The number of bands must be at least 1')
+    if args.controlrate is not None and args.controlrate <= 0:
+        raise ValueError('The control rate must be above 0Hz')
+
+    if args.offline and args.nocache:
+        raise ValueError('Cannot work offline without the cache')
+
+    if len(args.surveys) < 1:
+        raise ValueError('Give at least one survey')
+
+    if args.pan and args.layout == 'surveys':
+        raise ValueError('Partials cannot be panned with a channel for each survey: use the stereo, mono or ambisonic layout')
+
+    if args.fitsfiles:
+        for f in args.fitsfiles:
+            if not os.path.isfile(f):
+                raise ValueError('No such FITS file: '+f)
+
+    if args.outfile and args.outfile.lower().endswith('.flac') and args.sampleformat == 'float':
+        raise ValueError('FLAC files cannot hold float samples: use 16 or 24 bit ones')
+
+    if args.movie_workers < 1 or args.movie_fps < 1 or args.movie_dpi < 1:
+        raise ValueError('The movie workers, frames per second and resolution must all be at least 1')
+
+# ---- The direction of the "sweep" and whether it is reversed, from the command line direction
+def sweepDirection(direction):
+
+    _s = direction
+    sdirn = _s.upper()
+    if sdirn == 'LR':
+        SweepDirn = "LR"
+        SweepFlip = False
+    elif sdirn == "RL":
+        SweepDirn = "LR"
+        SweepFlip = True
+    elif sdirn == "TB":
+        SweepDirn = "TB"
+        SweepFlip = False
+    elif sdirn == "BT":
+        SweepDirn = "TB"
+        SweepFlip = True
+    elif sdirn == "CLK":
+        SweepDirn = "RAD"
+        SweepFlip = False
+    elif sdirn == "ACLK":
+        SweepDirn = "RAD"
+        SweepFlip = True
+    else:
+        raise ValueError('Unknown direction for the "sweep": '+direction)
+
+    return SweepDirn, SweepFlip
+
+# ---- The DSS image processing and sound parameter dictionaries for the command line settings
+def makeParameters(args):
+
+    imageParameters = {
+        "pixelSize": args.imagesize,
+        "surveys": args.surveys,  # The surveys to fetch, one image (and channel) for each
+        "medianSubtract": True,
+        "scaling": "Default",  # ++TODO++ Does nothing yet
+        "cacheDir": None if args.nocache else args.cachedir,  # Where to keep downloaded data (None for nowhere)
+        "cacheMB": args.cachesize,  # How much downloaded data to keep
+        "renderMB": args.rendercachesize,  # How much sound (made with a seed) to keep
+        "offline": args.offline,  # Only use data from the cache
+        "source": args.source,  # Where to get data from (None for SkyView)
+        "fitsFiles": args.fitsfiles  # Local FITS files to memory map instead (None for DSS data)
+    }
+
+    SweepDirn, SweepFlip = sweepDirection(args.direction)
+
+    soundParameters = {
+        "filename": args.outfile,
+        "sampleRate": args.samplerate,
+        "soundLength": args.soundlen,
+        "freqMinHz": args.lowfreq,
+        "freqMaxHz": args.highfreq,
+        "flipFreq": args.flipfreq,  # Reverse the order of frequencies
+        "flipDirn": SweepFlip,  # Reverse the direction of the sweep
+        "minSubtract": args.minsubtract, # Subtract the minimum from each amplification row
+        "engine": args.engine,  # How to generate the sound: "sine" or "ifft"
+        "bilinear": args.bilinear,  # Interpolate between pixels rather than take the nearest (radial sweeps)
+        "interp": args.interp,  # How the envelopes go between pixels: "linear", "cubic" or "sinc"
+        "layout": args.layout,  # How the images are mixed to the output channels (see sonifydss.channels)
+        "pan": args.pan,  # Place each partial by its position instead (see sonifydss.panning)
+        "controlRate": args.controlrate,  # Rate (Hz) to work the envelopes out at (None for every sample)
+        "sampleFormat": args.sampleformat,  # Samples of the output file: "16", "24" (bit integers) or "float"
+        "oscillator": args.oscillator,  # How the sine engine makes its sines: "sin" or "phasor"
+        "dtype": args.dtype,  # Precision to generate the sound in: "float64" or "float32"
+        "seed": args.seed,  # Seed for the random phases (None for different ones every time)
+        "gainDb": args.gain,  # Level of the loudest sample of the output, in dB relative to full scale
+        "bands": args.bands,  # Number of partials to combine the rows into (None for one per row)
+        "bandAggregate": args.aggregate,  # How to combine them: "mean", "max" or "energy"
+        "workers": args.workers,  # Number of processes generating the sound
+        "movieFps": args.movie_fps,  # Frames per second of the movie
+        "movieDpi": args.movie_dpi,  # Resolution of the movie (8 inches square)
+        "movieWorkers": args.movie_workers  # Number of processes making the movie
+    }
+    soundParameters["soundLenSam"] = int(soundParameters["sampleRate"] * soundParameters["soundLength"])
+    soundParameters["sweepDirn"] = SweepDirn
+
+    return imageParameters, soundParameters
+
+
+# ======================================================================================================
+# ==== Download DSS data for a list of targets into the cache, e.g.
+#   python sonify-dss.py prefetch targets.txt
+
+def prefetchMain(argv):
+    parser = argparse.ArgumentParser(prog='sonify-dss.py prefetch', description='Download DSS images for a list of targets into the cache.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('targets', help='A file with one "object angsize [imagesize]" per line')
+    parser.add_argument('-siz', '--imagesize', nargs='?', type=int, default=500, help='The DSS image size in pixels, for targets that do not give one')
+    parser.add_argument('-cd', '--cachedir', nargs='?', default=DEFAULT_CACHE_DIR, help='The directory to keep downloaded DSS data in (or set SONIFYDSS_CACHE)')
+    parser.add_argument('-cs', '--cachesize', nargs='?', type=float, default=DEFAULT_CACHE_MB, help='The most DSS data to keep in the cache (in MB)')
+    parser.add_argument('-src', '--source', nargs='?', default=None, help='Where to get DSS data from: the URL of a SkyView-like server or a directory of FITS files (default: SkyView)')
+    parser.add_argument('-sv', '--surveys', nargs='+', metavar='SURVEY', default=DEFAULT_SURVEYS, help='The SkyView surveys to download for each target')
+    parser.add_argument('-c', '--concurrency', nargs='?', type=int, default=4, help='The number of targets to download at once')
+    args = parser.parse_args(argv)
+
+    imageParameters = {
+        "pixelSize": args.imagesize,
+        "scaling": "Default",
+        "cacheDir": args.cachedir,
+        "cacheMB": args.cachesize,
+        "offline": False,
+        "source": args.source
+    }
+    targets = readTargets(args.targets, args.imagesize)
+    print("Prefetching DSS data for "+str(len(targets))+" targets into "+args.cachedir)
+    failed = prefetchTargets(targets, args.surveys, imageParameters, max(1, args.concurrency))
+    sys.exit(1 if failed else 0)
+
+# ======================================================================================================
+# ==== Sonify every job in a manifest in one go, e.g.
+#   python sonify-dss.py batch jobs.csv
+
+def batchMain(argv):
+    parser = argparse.ArgumentParser(prog='sonify-dss.py batch', description='Sonify many DSS images in one go.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('manifest', help='A CSV file (with a header row) or YAML file of jobs, each with the same settings as the command line')
+    parser.add_argument('-j', '--jobs', nargs='?', type=int, default=1, help='The number of jobs to run at once')
+    parser.add_argument('-sum', '--summary', nargs='?', default=None, help='Where to write the JSON summary of the timings (default: the manifest with .json on the end)')
+    batchArgs = parser.parse_args(argv)
+    numJobs = max(1, batchArgs.jobs)
+
+    # Check every job before starting any of them
+    jobParser = makeParser()
+    jobs = readManifest(batchArgs.manifest)
+    jobArgs = []
+    for i, job in enumerate(jobs):
+        _name = 'Job '+str(i+1)+' in '+batchArgs.manifest
+        try:
+            _a = jobParser.parse_args(jobArgv(job, ['object', 'angsize', 'outfile', 'soundlen']))
+            checkArgs(_a)
+        except SystemExit:
+            sys.exit(_name+' has bad settings (see above)')
+        except ValueError as e:
+            sys.exit(_name+': '+str(e))
+        if numJobs > 1 and _a.workers > 1:
+            sys.exit(_name+': jobs cannot have more than one worker when more than one job runs at once')
+        jobArgs.append(_a)
+
+    # The DSS images of each field are fetched once and shared by the jobs that use them
+    def fieldKey(args):
+        imageParameters, _ = makeParameters(args)
+        return (" ".join(args.object.upper().split()), args.angsize, json.dumps(imageParameters, sort_keys=True))
+    counts = {}
+    for _a in jobArgs:
+        counts[fieldKey(_a)] = counts.get(fieldKey(_a), 0) + 1
+    getField, releaseField = sharedItems(counts)
+
+    # Matplotlib can only draw one thing at a time
+    plotLock = threading.Lock()
+
+    def runJob(i, job, times):
+        args = jobArgs[i]
+        sonifier = Sonifier(*makeParameters(args))
+        key = fieldKey(args)
+        try:
+            with timeStage(times, "fetch"):
+                imgs, _ = getField(key, lambda: sonifier.fetch(args.object, args.angsize))
+                sonifier.setImages(*imgs)
+
+            if args.picture:
+                with timeStage(times, "picture"), plotLock:
+                    sonifier.picture(args.picture[0])
+
+            with timeStage(times, "sample"):
+                sonifier.sample()
+
+            if args.stream:
+                from sonifydss.output import writeSoundStream
+                _t0 = time.perf_counter()
+                writeSoundStream(timedBlocks(sonifier.blocks(), times, "synthesize"), sonifier.numChannels(), sonifier.sndpars, progress=False)
+                times["write"] = time.perf_counter() - _t0 - times.get("synthesize", 0.0)
+            else:
+                with timeStage(times, "synthesize"):
+                    sonifier.synthesize(progress=False)
+                with timeStage(times, "write"):
+                    sonifier.encode()
+
+            if args.movie:
+                with timeStage(times, "movie"), plotLock:
+                    sonifier.movie(args.movie[0])
+        finally:
+            releaseField(key)
+
+    print("Running "+str(len(jobs))+" jobs from "+batchArgs.manifest+" ("+str(len(counts))+" fields), "+str(numJobs)+" at a time")
+    _t0 = time.perf_counter()
+    results = runBatch(jobs, runJob, numJobs)
+    summary = batchSummary(jobs, results, time.perf_counter() - _t0, numJobs)
+    summary["fields"] = len(counts)
+
+    sumfil = batchArgs.summary if batchArgs.summary else batchArgs.manifest + ".json"
+    with open(sumfil, "w") as f:
+        json.dump(summary, f, indent=2)
+    print("Written timings to "+sumfil)
+    sys.exit(1 if summary["failed"] else 0)
+
+# ======================================================================================================
+# ==== Play a field over and over, taking changes to the settings while it plays, e.g.
+#   python sonify-dss.py live M51 10 30
+
+def liveMain(argv):
+    from sonifydss.live import LIVE_HOST, LIVE_PORT, LiveSonifier, serveLive
+
+    parser = makeParser(prog='sonify-dss.py live', description='Play a DSS image over and over, changing how it is sonified while it plays.', outfile=False)
+    parser.add_argument('-H', '--host', nargs='?', default=LIVE_HOST, help='The address to listen for changes on')
+    parser.add_argument('-P', '--port', nargs='?', type=int, default=LIVE_PORT, help='The port to listen for changes on')
+    args = parser.parse_args(argv)
+
+    try:
+        checkArgs(args)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    sonifier = Sonifier(*makeParameters(args))
+    print("Loading DSS data for "+args.object)
+    try:
+        sonifier.fetch(args.object, args.angsize)
+    except LookupError as e:
+        sys.exit(str(e))
+
+    serveLive(LiveSonifier(sonifier.imgs, sonifier.sndpars, args.direction, args.device), args.host, args.port)
+
+# ==== Send changes to a live sonification, e.g.
+#   python sonify-dss.py control freqMinHz=100 direction=tb
+
+def controlMain(argv):
+    from sonifydss.live import LIVE_HOST, LIVE_PORT, LIVE_SETTINGS, sendControl, testControl
+
+    parser = argparse.ArgumentParser(prog='sonify-dss.py control', description='Change the settings of a live sonification.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('settings', nargs='*', help='Settings to change, as name=value, any of: '+', '.join(LIVE_SETTINGS))
+    parser.add_argument('-H', '--host', nargs='?', default=LIVE_HOST, help='The address of the live sonification')
+    parser.add_argument('-P', '--port', nargs='?', type=int, default=LIVE_PORT, help='The port of the live sonification')
+    parser.add_argument('--status', action='store_true', help='Show the current settings and how the playing is going')
+    parser.add_argument('--stop', action='store_true', help='Stop the live sonification')
+    parser.add_argument('--test', nargs='?', type=int, const=20, default=None, help='Send this many random changes and show how long each took to be heard')
+    args = parser.parse_args(argv)
+
+    if args.test:
+        res = testControl(args.test, args.host, args.port)
+        print(json.dumps(res, indent=2))
+        sys.exit(1 if res["failed"] else 0)
+
+    changes = {}
+    for s in args.settings:
+        name, sep, value = s.partition("=")
+        if not sep:
+            sys.exit('Settings should be name=value: '+s)
+        try:
+            changes[name] = json.loads(value)
+        except ValueError:
+            changes[name] = value
+
+    if changes:
+        msg = {"set": changes}
+    elif args.stop:
+        msg = {"stop": True}
+    else:
+        msg = {"status": True}
+    try:
+        reply = sendControl(msg, args.host, args.port)
+    except OSError as e:
+        sys.exit('Cannot reach the live sonification at '+args.host+':'+str(args.port)+': '+str(e))
+    print(json.dumps(reply, indent=2))
+    sys.exit(0 if reply.get("ok") else 1)
+
+# ======================================================================================================
+# ==== Sonify one field, e.g.
+#   python sonify-dss.py M51 10 m51.wav 30
+
+def sonifyMain(argv):
+
+    parser = makeParser()
+    args=parser.parse_args(argv)
+
+    try:
+        checkArgs(args)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    ObjectName = args.object
+
+    # ==== Time everything from here on?
+    profiler = None
+    if args.profile or args.trace:
+        profiler = Profiler()
+        profiler.begin()
+
+    # ==== Define the DSS image processing and sound parameters in dictionaries
+    imageParameters, soundParameters = makeParameters(args)
+    sonifier = Sonifier(imageParameters, soundParameters)
+
+    # ==== Load an image
+
+    print("Loading DSS data for "+ObjectName)
+    try:
+        sonifier.fetch(ObjectName, args.angsize)
+    except LookupError as e:
+        sys.exit(str(e))
+
+    if args.picture:
+        print("Making images of the DSS data. See "+args.picture[0])
+        sonifier.picture(args.picture[0])
+
+    # ==== Create the actual sound
+
+    print("Creating sound")
+    sonifier.sample()
+    if args.liveplay:
+        # Play the sound as it is generated, and write it at the same time
+        print("Playing sound as it is created")
+        report = sonifier.playStream(args.device)
+        print(formatReport(report))
+        print("Written sound to "+args.outfile)
+    elif args.stream:
+        # Generate and write the sound a block at a time
+        sonifier.encode()
+        print("\nWritten sound to "+args.outfile)
+    else:
+        sonifier.synthesize()
+        print("\nWriting sound to "+args.outfile)
+        sonifier.encode()
+    if sonifier.fromCache:
+        print("(The sound was made before with the same seed and settings, so was taken from the cache)")
+
+    if args.movie:
+        print('Making "sweep" movie of the DSS data. See '+args.movie[0])
+        sonifier.movie(args.movie[0])
+
+    if args.play and not args.liveplay:
+        print("Playing sound")
+        sonifier.play()
+
+    if profiler:
+        profiler.end()
+        print(formatProfile(profiler.report()))
+        if args.profile:
+            profiler.writeJson(args.profile)
+            print("Written timings to "+args.profile)
+        if args.trace:
+            profiler.writeTrace(args.trace)
+            print("Written trace to "+args.trace)
+
+
+    print("Finished")
+
+
+# ======================================================================================================
+# ==== Which of the above
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if len(argv) > 0 and argv[0] == "prefetch":
+        prefetchMain(argv[1:])
+    elif len(argv) > 0 and argv[0] == "batch":
+        batchMain(argv[1:])
+    elif len(argv) > 0 and argv[0] == "live":
+        liveMain(argv[1:])
+    elif len(argv) > 0 and argv[0] == "control":
+        controlMain(argv[1:])
+    else:
+        sonifyMain(argv)
@@ -0,0 +1,197 @@
+"""
+Getting DSS images: from the local cache if possible, otherwise from SkyView.
+
+Where the images come from is pluggable. A "fetcher" is any function
+    fetcher(position, survey, pixels, radius, scaling) -> HDUList
+and makeFetcher() builds one from a simple description: SkyView itself, another
+SkyView-compatible server (e.g. a local stand-in for testing) or a directory of FITS files.
+The surveys for a field are fetched at the same time on a pool of threads, each with a few
+retries (with increasing waits between them) in case the server is busy or the network drops out.
+Anything waiting will not fix (an unknown survey or object, a bad parameter, a missing file, an
+HTTP error other than 429 or 5xx) is raised straight away.
+
+The surveys are whichever SkyView has (imgpars["surveys"], e.g. "DSS2 Red", "DSS2 IR", "2MASS-K"),
+one image (and one channel of the sound, see sonifydss.channels) for each. Local FITS files given
+instead (imgpars["fitsFiles"]) are memory mapped rather than read in, so they can be much bigger
+than memory (see sonifydss.mapped).
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from sonifydss.cache import resolvePosition, fitsCachePath, fitsCacheGet, fitsCachePut
+from sonifydss.mapped import openMapped
+from sonifydss.profiling import stage
+
+# How many times to try each download, and how long to wait (in seconds) before the first retry.
+# The wait doubles for each retry after that.
+FETCH_TRIES = 4
+FETCH_BACKOFF = 2.0
+
+# HTTP statuses worth trying again after a wait: too many requests, and the server's own errors
+RETRY_HTTP_STATUSES = [429] + list(range(500, 600))
+
+# The surveys used unless others are asked for: DSS2 Red for the left channel, Blue for the right
+DEFAULT_SURVEYS = ['DSS2 Red', 'DSS2 Blue']
+
+
+# ---- Fetchers
+
+# Get images from SkyView (or a server that behaves like it at the given URL)
+def skyviewFetcher(url=None):
+    def fetch(position, survey, pixels, radius, scaling):
+        from astroquery.skyview import SkyView
+        from astropy import units as u
+        sv = SkyView()
+        if(url):
+            sv.URL = url
+        # For other options, see https://astroquery.readthedocs.io/en/latest/api/astroquery.skyview.SkyViewClass.html#astroquery.skyview.SkyViewClass.get_images
+        imgs = sv.get_images(position=position, survey=[survey], scaling=scaling,
+                             coordinates='J2000', pixels=pixels, radius=(radius * u.arcmin))
+        return imgs[0]
+    return fetch
+
+# Get images from a directory of FITS files, named "<position>_<survey>.fits" with spaces
+# replaced by underscores (e.g. "M51_DSS2_Red.fits"). The pixels, radius and scaling are ignored.
+def directoryFetcher(dirname):
+    def fetch(position, survey, pixels, radius, scaling):
+        _f = os.path.join(dirname, "_".join((position + " " + survey).split()) + ".fits")
+        if(not os.path.exists(_f)):
+            raise FileNotFoundError("No "+survey+" data for "+position+" in "+dirname)
+        from astropy.io import fits
+        return fits.open(_f, memmap=False)
+    return fetch
+
+# A fetcher from a description: None for SkyView, a URL for a SkyView-like server, or a directory
+def makeFetcher(source):
+    if(not source):
+        return skyviewFetcher()
+    if(source.startswith("http://") or source.startswith("https://")):
+        return skyviewFetcher(source)
+    return directoryFetcher(source)
+
+# Whether a fetch that failed with e might work if tried again: network trouble and timeouts
+# (OSErrors, which include urllib's URLError and requests' errors), unless they are a missing file
+# or an HTTP error that is not RETRY_HTTP_STATUSES
+def isTransient(e):
+    if(not isinstance(e, OSError) or isinstance(e, FileNotFoundError)):
+        return False
+    # urllib's HTTPError has the status as code, requests' has it on its response
+    status = getattr(e, "code", None)
+    if(getattr(e, "response", None) is not None):
+        status = getattr(e.response, "status_code", status)
+    if(isinstance(status, int)):
+        return status in RETRY_HTTP_STATUSES
+    return True
+
+# Call a fetcher, trying again (after a wait) if it fails in a way that waiting might fix
+def fetchWithRetry(fetcher, position, survey, pixels, radius, scaling, tries=FETCH_TRIES, backoff=FETCH_BACKOFF):
+    for t in range(0, tries):
+        try:
+            return fetcher(position, survey, pixels, radius, scaling)
+        except Exception as e:
+            if(t == tries-1 or not isTransient(e)):
+                raise
+            time.sleep(backoff * 2**t)
+
+
+# ---- Getting the images for a field
+
+# The images (HDULists) of the given surveys for a field, in the same order as the surveys
+def getImages(objcoo, angsize, surveys, imgpars):
+    scl = None
+    if(imgpars["scaling"] != "Default"):
+        scl = imgpars["scaling"]
+
+    # Use anything already in the local cache
+    imgs = [None] * len(surveys)
+    cachedir = imgpars["cacheDir"]
+    if(cachedir):
+        radec = resolvePosition(objcoo, cachedir, imgpars["offline"])
+        paths = [fitsCachePath(cachedir, radec, s, angsize, imgpars) for s in surveys]
+        imgs = [fitsCacheGet(p) for p in paths]
+
+    # And fetch the rest, all at once
+    missing = [i for i in range(0,len(surveys)) if imgs[i] is None]
+    if(missing and imgpars["offline"]):
+        raise LookupError("No cached "+", ".join([surveys[i] for i in missing])+" data for "+objcoo+" (working offline)")
+    if(missing):
+        fetcher = makeFetcher(imgpars["source"])
+        with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+            jobs = [pool.submit(fetchWithRetry, fetcher, objcoo, surveys[i], imgpars["pixelSize"], angsize/2.0, scl)
+                    for i in missing]
+            for i, job in zip(missing, jobs):
+                imgs[i] = job.result()
+                if(cachedir):
+                    fitsCachePut(paths[i], imgs[i], cachedir, imgpars["cacheMB"])
+
+    return imgs
+
+
+# ---- The data for a field: an image from each survey, median subtracted if asked
+
+# An image less its median, clipped at zero, making just the one new full size array
+def medianSubtracted(data):
+    with stage("median", data.size):
+        _tmp = data - np.median(data)
+        return np.clip(_tmp, 0.0, None, out=_tmp)
+
+# The images of a field as a list, one for each of imgpars["surveys"] (or imgpars["fitsFiles"])
+def getDSSdata(objcoo, angsize, imgpars):
+
+    # Local FITS files are memory mapped, and only read a slice at a time
+    if(imgpars.get("fitsFiles")):
+        with stage("fetch"):
+            return openMapped(imgpars["fitsFiles"], imgpars)
+
+    # From the local cache or SkyView (or wherever the image parameters say)
+    with stage("fetch"):
+        hduls = getImages(objcoo, angsize, imgpars.get("surveys", DEFAULT_SURVEYS), imgpars)
+    imgs = [hdul[0].data for hdul in hduls]
+    if(any(img.shape != imgs[0].shape for img in imgs)):
+        raise ValueError("The survey images are different sizes: "+", ".join(str(img.shape) for img in imgs))
+
+    # Median subtract?
+    if(imgpars["medianSubtract"]):
+        imgs = [medianSubtracted(img) for img in imgs]
+
+    return imgs
+
+
+# ---- Prefetching
+
+# Read a list of targets: one "object angsize [imagesize]" per line. Blank lines and anything
+# after a # are ignored, and object names with spaces need quoting.
+def readTargets(filename, pixelSize):
+    import shlex
+    targets = []
+    with open(filename) as f:
+        for line in f:
+            _w = shlex.split(line, comments=True)
+            if(len(_w) == 0):
+                continue
+            targets.append((_w[0], float(_w[1]), int(_w[2]) if len(_w) > 2 else pixelSize))
+    return targets
+
+# Download the images for all the targets into the cache, a few at a time.
+#   Returns the (target, error) pairs for those that failed.
+def prefetchTargets(targets, surveys, imgpars, concurrency=4):
+
+    def _get(target):
+        _pars = dict(imgpars, pixelSize=target[2])
+        getImages(target[0], target[1], surveys, _pars)
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        jobs = [(t, pool.submit(_get, t)) for t in targets]
+        for t, job in jobs:
+            try:
+                job.result()
+                print("  Got "+t[0]+" ("+str(t[1])+" arcmin, "+str(t[2])+" pixels)")
+            except Exception as e:
+                print("  Failed to get "+t[0]+": "+str(e))
+                failed.append((t, e))
+    return failed
@@ -0,0 +1,223 @@
+"""
+Inverse-FFT / overlap-add oscillator bank for SonifyDSS (--engine ifft).
+
+Every partial has a fixed frequency and an amplitude that only changes slowly, so rather than
+evaluating a sine for every partial at every sample, short frames of the sound are built directly
+as spectra and turned into sound with an inverse FFT:
+
+  * Each frame is IFFT_SIZE samples long and its spectrum is the sum, over the partials, of the
+    (Blackman-Harris windowed) spectrum of a sinusoid at that partial's frequency, scaled by the
+    partial's amplitude and phase at the middle of the frame. A windowed sinusoid only has
+    significant spectral content within a few bins of its frequency, so each partial touches just
+    KERNEL_BINS bins either side and a frame's spectrum is a sparse matrix product.
+  * The middle half of each frame is re-weighted from the Blackman-Harris window to a triangle,
+    and the frames are overlap-added a quarter frame apart. The triangles add up to one, so each
+    partial's amplitude is a straight line between the frame middles.
+
+ifftErrorBound() gives a bound on how far this can be from the sine-sum output of synthBlocks()
+(checked by python -m sonifydss.bench --ifft).
+The spectra are always worked out in double precision (there are far fewer of them than there are
+samples), and only the overlap-add is done in the precision asked for.
+"""
+
+import warnings
+
+import numpy as np
+from scipy import sparse
+from functools import lru_cache
+
+from sonifydss.synth import samplePositions, interpPlan, applyPlan, envelopeMin, envelopeSamples, synthDtype, BLOCK_PARTIALS
+from sonifydss.profiling import stage
+
+# Length of each frame, the number of bins kept either side of each partial's frequency,
+# the number of frames rendered together and the number of rows read at a time for them
+IFFT_SIZE = 1024
+KERNEL_BINS = 6
+BLOCK_FRAMES = 256
+READ_PARTIALS = 1024
+
+# 4-term Blackman-Harris window coefficients (sidelobes below -92dB)
+_BH4 = (0.35875, 0.48829, 0.14128, 0.01168)
+
+
+# ---- Frame and window set up
+
+# The (periodic) Blackman-Harris analysis window
+def bhWindow(n):
+    _m = 2 * np.pi * np.arange(0, n) / n
+    return _BH4[0] - _BH4[1]*np.cos(_m) + _BH4[2]*np.cos(2*_m) - _BH4[3]*np.cos(3*_m)
+
+# The weights that turn the middle half of a Blackman-Harris windowed frame into a triangle
+def olaWeights(n):
+    hop = n // 4
+    _m = np.arange(hop, 3*hop)
+    tri = 1.0 - np.abs(_m - 2*hop) / hop
+    return tri / bhWindow(n)[hop:3*hop]
+
+# The spectra (bins 0 to n/2) of a windowed sinusoid at each frequency
+#   Returns the sparse (bins, 2*partials) matrix for the positive and negative frequency parts
+#   of each partial and the part of each partial's spectrum that was left out
+# These only depend on the frequencies and sample rate, so are cached for sounds that share them.
+def ifftKernels(freqs, sndpars):
+    return _ifftKernels(np.asarray(freqs, float).tobytes(), sndpars["sampleRate"])
+
+@lru_cache(maxsize=8)
+def _ifftKernels(freqBytes, sampleRate):
+    n = IFFT_SIZE
+    numBin = n//2 + 1
+    cyc = np.frombuffer(freqBytes, dtype=float) / sampleRate   # Cycles per sample
+    win = bhWindow(n)
+
+    numSnds = cyc.shape[0]
+    bins, cols, vals = [], [], []
+    leak = np.zeros(numSnds)
+    for p in range(0, cyc.shape[0]):
+        _k = np.fft.fft(win * np.exp(2j*np.pi*cyc[p]*np.arange(0, n)))
+        # Positive frequency part, and negative frequency part (mirrored from the positive one)
+        kpos = _k[:numBin]
+        kneg = np.conj(_k[(n - np.arange(0, numBin)) % n])
+        b = np.arange(0, numBin)
+        keepPos = np.abs(b - cyc[p]*n) <= KERNEL_BINS
+        keepNeg = np.abs(b + cyc[p]*n) <= KERNEL_BINS
+        leak[p] = (np.sum(np.abs(kpos[~keepPos])) + np.sum(np.abs(kneg[~keepNeg]))) / n
+        # Only the kept bins, so that many partials never need a dense (bins, 2*partials) matrix
+        for keep, k, c in ((keepPos, kpos, p), (keepNeg, kneg, numSnds + p)):
+            bins.append(np.flatnonzero(keep))
+            cols.append(np.full(bins[-1].shape[0], c))
+            vals.append(k[keep])
+
+    kern = sparse.csr_matrix((np.concatenate(vals) / 2, (np.concatenate(bins), np.concatenate(cols))),
+                             shape=(numBin, 2*numSnds))
+    kern.sort_indices()
+    # Shared by everything that uses the cache, so make sure nobody changes them
+    kern.data.flags.writeable = False
+    leak.flags.writeable = False
+    return kern, leak
+
+
+# ---- The engine itself
+
+# Whether there are fewer samples a pixel along the sweep than between frame middles. The envelopes
+# can then turn several times between frames, which the straight lines between frames miss, and
+# ifftErrorBound() can come close to the peak itself (see sonifydss.bench --ifft).
+def ifftTooCoarse(numPts, sndpars):
+    return sndpars["soundLenSam"] / max(1, numPts-1) < IFFT_SIZE // 4
+
+# Generate the sound in time blocks, as synthBlocks() does but with inverse FFTs
+def ifftBlocks(rows, freqs, phs, sndpars):
+    numChan, numSnds, numPts = rows.shape
+    lenSam = sndpars["soundLenSam"]
+    n = IFFT_SIZE
+    hop = n // 4
+
+    if(ifftTooCoarse(numPts, sndpars)):
+        warnings.warn("Only {:.0f} samples a pixel along the sweep, fewer than the {} between ifft frames, so the sound "
+                      "can be noticeably different from --engine sine (use a longer sound or --engine sine)".format(lenSam / max(1, numPts-1), hop))
+
+    if(sndpars["minSubtract"]):
+        rows = rows - envelopeMin(rows, sndpars)
+
+    kern, leak = ifftKernels(freqs, sndpars)
+    corr = olaWeights(n)
+
+    # Phase (of a cosine) at the start of frame zero and the phase step from frame to frame.
+    # The random phases are offsets in time, as in synthBlocks().
+    cyc = np.asarray(freqs, float) / sndpars["sampleRate"]
+    phase0 = 2*np.pi*np.asarray(freqs, float)*np.asarray(phs, float) - np.pi/2 - 2*np.pi*cyc*(n//2)
+    step = 2*np.pi*np.mod(cyc*hop, 1.0)
+    rot = np.exp(1j * np.multiply.outer(step, np.arange(0, BLOCK_FRAMES)))
+
+    # Frame k is centred on sample k*hop and its triangle covers the samples hop either side
+    numFrm = (lenSam-1)//hop + 2
+    dtype = synthDtype(sndpars)
+    carry = np.zeros((numChan, hop), dtype)
+    for k0 in range(0, numFrm, BLOCK_FRAMES):
+        k1 = min(k0 + BLOCK_FRAMES, numFrm)
+        nf = k1 - k0
+
+        # Amplitudes at the middle of each frame (channels, partials, frames), interpolated as
+        # synthBlocks() does. The last frames are past the end of the sound, where a linear
+        # envelope carries on in a straight line. Only the pixels these frames need are read,
+        # READ_PARTIALS rows at a time (the rows may not all be in memory, see sonifydss.mapped).
+        plan = interpPlan(samplePositions(np.arange(k0, k1) * hop, numPts, sndpars), numPts, sndpars.get("interp", "linear"))
+        _k = np.amin(plan[0])
+        plan = (plan[0] - _k, plan[1])
+        amp = np.empty((numChan, numSnds, nf), np.result_type(rows.dtype, plan[1].dtype))
+        for p in range(0, numSnds, READ_PARTIALS):
+            _r = rows[:, p:p+READ_PARTIALS, _k:_k+np.amax(plan[0])+1]
+            amp[:, p:p+READ_PARTIALS] = applyPlan(lambda i: _r[:, :, i], plan, amp.dtype)
+
+        # Phases at the start of each frame
+        ph = np.exp(1j * np.mod(phase0 + k0*step, 2*np.pi))[:, None] * rot[:, :nf]
+
+        seg = np.zeros((numChan, nf+1, hop), dtype)
+        for ch in range(0, numChan):
+            with stage("oscillator", numSnds*nf*hop):
+                a = amp[ch] * ph
+                spec = kern @ np.concatenate((a, np.conj(a)))
+                frm = np.fft.irfft(spec, n=n, axis=0)[hop:3*hop].T * corr
+            with stage("accumulate", nf*hop):
+                seg[ch, :-1] += frm[:, :hop]
+                seg[ch, 1:] += frm[:, hop:]
+        seg[:, 0] += carry
+        carry = seg[:, -1].copy()
+
+        # Samples from hop before the first frame's middle up to the last frame's middle are finished
+        s = (k0-1) * hop
+        block = seg[:, :-1].reshape(numChan, nf*hop)
+        if(s < 0):
+            block = block[:, -s:]
+            s = 0
+        block = block[:, :max(0, lenSam-s)]
+        if(block.shape[1] > 0):
+            yield s, block
+
+
+# ---- How close is it to the sine-sum?
+
+# An upper bound, per channel, on the difference between the ifft engine and the sine-sum of
+# synthBlocks() (without a --controlrate) for the same rows, frequencies and phases. Between the
+# middles of frames f and f+1 each partial of the ifft engine is a straight line L between its
+# amplitudes there rather than the envelope A interpolated between pixels, and each frame leaves
+# out the spectrum beyond KERNEL_BINS of each partial. So no sample can be further out than
+#   * the sum over the partials of |A - L| there, and
+#   * the spectrum left out of frames f and f+1, scaled up by the largest overlap-add weight.
+# A - L is a straight line everywhere but at the pixels and the frame middles, so for a linear
+# envelope it is largest at one of the samples of envelopeSamples() or at a frame middle, and only
+# those are looked at (a smooth envelope is taken MIN_POINTS_PER_PIXEL times a pixel). The rows
+# are read BLOCK_PARTIALS at a time.
+def ifftErrorBound(rows, freqs, sndpars):
+    numChan, numSnds, numPts = rows.shape
+    lenSam = sndpars["soundLenSam"]
+    kernel = sndpars.get("interp", "linear")
+    hop = IFFT_SIZE // 4
+
+    if(sndpars["minSubtract"]):
+        rows = rows - envelopeMin(rows, sndpars)
+
+    _, leak = ifftKernels(freqs, sndpars)
+    corr = olaWeights(IFFT_SIZE)
+    gain = np.amax(corr[:hop] + corr[hop:])
+
+    # The samples to look at, the frame middle before each and how far they are towards the next
+    numFrm = (lenSam-1)//hop + 2
+    _n = envelopeSamples(numPts, sndpars)
+    if(sndpars["flipDirn"]):
+        _n = (lenSam-1) - _n
+    t = np.unique(np.concatenate((_n, np.arange(0, numFrm-1) * hop)))
+    f = t // hop
+    w = (t - f*hop) / hop
+
+    frmPlan = interpPlan(samplePositions(np.arange(0, numFrm) * hop, numPts, sndpars), numPts, kernel)
+    envPlan = interpPlan(samplePositions(t, numPts, sndpars), numPts, kernel)
+    envErr = np.zeros((numChan, len(t)))
+    leakErr = np.zeros((numChan, numFrm))
+    for p in range(0, numSnds, BLOCK_PARTIALS):
+        _r = rows[:, p:p+BLOCK_PARTIALS]
+        amp = applyPlan(lambda i: _r[:, :, i], frmPlan, float)
+        env = applyPlan(lambda i: _r[:, :, i], envPlan, float)
+        envErr += np.sum(np.abs(env - (amp[:, :, f] + (amp[:, :, f+1] - amp[:, :, f]) * w)), axis=1)
+        leakErr += np.sum(np.abs(amp) * leak[p:p+BLOCK_PARTIALS, None], axis=1)
+
+    leakErr = np.maximum(leakErr[:, :-1], leakErr[:, 1:]) * gain
+    return np.amax(envErr + leakErr[:, f], axis=1)
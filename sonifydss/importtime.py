@@ -0,0 +1,60 @@
+"""
+How long the core of sonifydss takes to import, checked against a budget:
+
+    python -m sonifydss.importtime
+
+The core modules are imported in a fresh interpreter (a few times, keeping the quickest) and
+the time taken is compared with IMPORT_BUDGET_MS. It also checks that none of the optional
+dependencies that are slow to import, or that look for an audio device or the network when
+imported, came in along the way. Exits with 1 if either check fails.
+"""
+
+import json
+import subprocess
+import sys
+
+# Most the core modules may take to import (in ms), and how many times to try
+IMPORT_BUDGET_MS = 250
+IMPORT_REPEATS = 5
+
+# Everything needed to make a sound from a pair of images, and the command line
+CORE_MODULES = ["sonifydss", "sonifydss.synth", "sonifydss.sampling", "sonifydss.sweeps",
+                "sonifydss.sonifier", "sonifydss.cli"]
+
+# Only to be imported by the features that use them
+LAZY_MODULES = ["astropy", "astroquery", "matplotlib", "moviepy", "sounddevice", "soundfile", "scipy", "yaml"]
+
+_CHILD = """
+import sys, time, json
+_t0 = time.perf_counter()
+for m in {modules!r}:
+    __import__(m)
+print(json.dumps({{"ms": 1000*(time.perf_counter()-_t0), "modules": sorted(sys.modules)}}))
+"""
+
+
+# Import the modules in a fresh interpreter: the time it took (ms) and every module it loaded
+def importTime(modules=CORE_MODULES):
+    _out = subprocess.run([sys.executable, "-c", _CHILD.format(modules=list(modules))],
+                          capture_output=True, text=True, check=True)
+    res = json.loads(_out.stdout)
+    return res["ms"], res["modules"]
+
+# The quickest of several imports, and which of the lazy modules were loaded
+def checkImports(modules=CORE_MODULES, repeats=IMPORT_REPEATS):
+    times = []
+    for _ in range(0, repeats):
+        ms, loaded = importTime(modules)
+        times.append(ms)
+    eager = sorted(m for m in loaded if m.split(".")[0] in LAZY_MODULES and "." not in m)
+    return min(times), eager
+
+
+if __name__ == "__main__":
+    ms, eager = checkImports()
+    ok = ms <= IMPORT_BUDGET_MS and len(eager) == 0
+    print("Importing "+", ".join(CORE_MODULES)+" took {:.1f}ms (budget {}ms)".format(ms, IMPORT_BUDGET_MS))
+    if(eager):
+        print("Imported eagerly: "+", ".join(eager))
+    print("OK" if ok else "FAILED")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,308 @@
+"""
+Live sonification: play a field over and over, and change how it is sonified while it plays.
+
+    python sonify-dss.py live M51 10 30 -dev null &
+    python sonify-dss.py control freqMinHz=100 direction=tb
+    python sonify-dss.py control --test 20
+
+The images (one for each survey), the rows (or columns, or rings) sampled from them for each direction and the
+phases of the partials are all kept, so a change only means working out new frequencies, or
+picking another set of rows. The sound is generated a short block at a time just ahead of the
+audio device (LIVE_AHEAD_SECONDS), and a change is picked up by the next block to be generated:
+the blocks already waiting to be played are left alone, and the old and new sounds are
+crossfaded over CROSSFADE_SECONDS. When the sweep gets to the end it crossfades back to the start.
+
+Changes come in as JSON, one message per line, over a local TCP connection:
+
+    {"set": {"position": 0.5, "freqMinHz": 100, "freqMaxHz": 3000, "flipFreq": true, "direction": "tb"}}
+    {"status": true}
+    {"stop": true}
+
+Each message gets a JSON reply. The reply to a "set" is sent once the change has reached the audio
+device, and gives the time that took (latencySeconds) from the message arriving.
+"""
+
+import json
+import math
+import queue
+import random
+import socket
+import socketserver
+import statistics
+import threading
+import time
+
+import numpy as np
+
+from sonifydss.synth import partialFreqs, partialOmegas, envelopeMin, spanBlock, synthDtype
+from sonifydss.sweeps import sweepPartials
+from sonifydss.playback import StreamPlayer, playbackGain
+from sonifydss.mapped import asRows
+from sonifydss.channels import channelMix, mixChannels, outputChannels
+
+# Where the server listens by default, the samples generated at a time, how far ahead of the
+# audio device they are generated and how long changes are crossfaded over (in seconds), and how
+# long to wait for a change to be played before giving up
+LIVE_HOST = "127.0.0.1"
+LIVE_PORT = 7117
+LIVE_BLOCK_SAMPLES = 512
+LIVE_AHEAD_SECONDS = 0.1
+CROSSFADE_SECONDS = 0.05
+CONTROL_TIMEOUT = 5.0
+
+# The settings that can be changed and the directions they can be changed to
+LIVE_SETTINGS = ["position", "freqMinHz", "freqMaxHz", "flipFreq", "direction"]
+LIVE_DIRECTIONS = ["lr", "rl", "tb", "bt", "clk", "aclk"]
+
+
+# ---- The server side
+
+# Plays a set of images over and over, with settings that can be changed while it plays.
+#   live = LiveSonifier([imgR, imgB], sndpars, device="null")
+#   live.run()   # Until live.stop(), e.g. from live.control(...) in another thread
+class LiveSonifier:
+
+    def __init__(self, imgs, sndpars, direction="lr", device=None):
+        self.imgs = list(imgs)
+        self.player = StreamPlayer(outputChannels(len(self.imgs), sndpars), sndpars, 1.0, device, ringSeconds=LIVE_AHEAD_SECONDS, prefillSeconds=LIVE_AHEAD_SECONDS/2)
+        self.fadeLen = max(1, int(CROSSFADE_SECONDS * sndpars["sampleRate"]))
+        self._partials = {}
+        self._controls = queue.Queue()
+        self._stop = threading.Event()
+
+        self.voice = self._voice(dict(sndpars), direction, 0)
+        self.fade = None
+
+    # The rows and phases for the sweep direction in the sound parameters, made once for each direction
+    def _rows(self, sndpars):
+        key = sndpars["sweepDirn"]
+        if(key not in self._partials):
+            rows, _, phs = sweepPartials(self.imgs, sndpars)
+            self._partials[key] = (rows, phs)
+        return self._partials[key]
+
+    # Everything needed to generate the sound with the given settings from sample s on
+    def _voice(self, sndpars, direction, s):
+        rows, phs = self._rows(sndpars)
+        gain = playbackGain(rows, sndpars)
+        rows = asRows(rows, synthDtype(sndpars))
+        if(sndpars["minSubtract"]):
+            rows = rows - envelopeMin(rows, sndpars)
+        omega, phase0 = partialOmegas(partialFreqs(rows.shape[1], sndpars), phs)
+        return {"sndpars": sndpars, "direction": direction, "rows": rows, "omega": omega,
+                "phase0": phase0, "gain": gain, "mix": channelMix(rows.shape[0], sndpars), "s": s}
+
+    # The current voice with some of its settings changed (raises ValueError if they make no sense)
+    def _changed(self, changes):
+        from sonifydss.cli import sweepDirection
+        sndpars = dict(self.voice["sndpars"])
+        direction = self.voice["direction"]
+        s = self.voice["s"]
+        for k, v in changes.items():
+            if(k == "position"):
+                s = int(min(max(float(v), 0.0), 1.0) * (sndpars["soundLenSam"]-1))
+            elif(k in ("freqMinHz", "freqMaxHz")):
+                sndpars[k] = float(v)
+            elif(k == "flipFreq"):
+                sndpars[k] = bool(v)
+            elif(k == "direction"):
+                direction = str(v).lower()
+                sndpars["sweepDirn"], sndpars["flipDirn"] = sweepDirection(direction)
+            else:
+                raise ValueError("Unknown setting: "+str(k)+" (can be "+", ".join(LIVE_SETTINGS)+")")
+        if(sndpars["freqMinHz"] >= sndpars["freqMaxHz"]):
+            raise ValueError("freqMinHz must be less than freqMaxHz")
+        # Leave room before the end of the sweep to crossfade back to the start
+        s = max(0, min(s, sndpars["soundLenSam"] - LIVE_BLOCK_SAMPLES - self.fadeLen - 1))
+        return self._voice(sndpars, direction, s)
+
+    # Start crossfading from the current voice (and any crossfade it is still in) to another
+    def _fadeTo(self, voice):
+        self.fade = {"from": self.voice, "fromFade": self.fade, "done": 0}
+        self.voice = voice
+
+    # Take in any changes that have come in since the last block
+    def _takeControls(self):
+        while True:
+            try:
+                changes, _t0, reply, done = self._controls.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self._fadeTo(self._changed(changes))
+            except (ValueError, TypeError) as e:
+                reply.update(ok=False, error=str(e))
+                done.set()
+                continue
+
+            def _played(t, reply=reply, done=done, _t0=_t0):
+                reply.update(ok=True, latencySeconds=t - _t0)
+                done.set()
+            self.player.markNext(_played)
+
+    # The next n samples of a voice, scaled. A voice that gets to the end of the sweep goes on
+    # from the start (though blocks() crossfades back to the start before then).
+    def _render(self, voice, n):
+        lenSam = voice["sndpars"]["soundLenSam"]
+        s = voice["s"]
+        voice["s"] = (s + n) % lenSam
+        parts = []
+        while(n > 0):
+            e = min(s + n, lenSam)
+            parts.append(spanBlock(voice["rows"], voice["omega"], voice["phase0"], s, e, voice["sndpars"]))
+            n -= e - s
+            s = 0
+        block = parts[0] if len(parts) == 1 else np.concatenate(parts, axis=1)
+        return voice["gain"] * mixChannels(block, voice["mix"])
+
+    # The next n samples of a voice crossfaded in from whatever was playing before it (fade)
+    def _mixed(self, voice, fade, n):
+        block = self._render(voice, n)
+        if(fade is None):
+            return block
+        # Equal power crossfade (the old and new sounds have nothing in common)
+        _x = np.clip((fade["done"] + np.arange(0, n)) / self.fadeLen, 0.0, 1.0) * (math.pi/2)
+        block = block * np.sin(_x) + self._mixed(fade["from"], fade["fromFade"], n) * np.cos(_x)
+        fade["done"] += n
+        if(fade["fromFade"] is not None and fade["fromFade"]["done"] >= self.fadeLen):
+            fade["fromFade"] = None
+        return block
+
+    # Generate the sound a block at a time until stopped
+    def blocks(self):
+        n = LIVE_BLOCK_SAMPLES
+        done = 0
+        while not self._stop.is_set():
+            self._takeControls()
+
+            # Go back to the start in time to crossfade to it by the end of the sweep (even in
+            # the middle of another crossfade)
+            lenSam = self.voice["sndpars"]["soundLenSam"]
+            if(self.voice["s"] + n + self.fadeLen >= lenSam):
+                self._fadeTo(dict(self.voice, s=0))
+
+            block = self._mixed(self.voice, self.fade, n)
+            if(self.fade is not None and self.fade["done"] >= self.fadeLen):
+                self.fade = None
+
+            yield done, block
+            done += n
+
+    # Play until stopped
+    def run(self):
+        for _ in self.player.play(self.blocks()):
+            pass
+
+    def stop(self):
+        self._stop.set()
+
+    # Change some settings (from any thread). Returns once the change can be heard (or has been
+    # turned down), with how long that took.
+    def control(self, changes):
+        reply = {}
+        done = threading.Event()
+        self._controls.put((dict(changes), time.perf_counter(), reply, done))
+        if(not done.wait(CONTROL_TIMEOUT)):
+            return {"ok": False, "error": "The change was not played within "+str(CONTROL_TIMEOUT)+"s"}
+        return reply
+
+    # The current settings and how the playing is going
+    def status(self):
+        voice = self.voice
+        sndpars = voice["sndpars"]
+        return {"ok": True,
+                "settings": {"position": voice["s"] / sndpars["soundLenSam"], "freqMinHz": sndpars["freqMinHz"],
+                             "freqMaxHz": sndpars["freqMaxHz"], "flipFreq": sndpars["flipFreq"],
+                             "direction": voice["direction"]},
+                "player": self.player.report()}
+
+    # Answer one control message
+    def handle(self, msg):
+        if(not isinstance(msg, dict)):
+            raise ValueError("Messages should be JSON objects")
+        if("set" in msg):
+            if(not isinstance(msg["set"], dict)):
+                raise ValueError('"set" should be a JSON object of settings')
+            return self.control(msg["set"])
+        if(msg.get("status")):
+            return self.status()
+        if(msg.get("stop")):
+            self.stop()
+            return {"ok": True}
+        raise ValueError('Messages should have "set", "status" or "stop" in them')
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if(not line.strip()):
+                continue
+            msg = None
+            try:
+                msg = json.loads(line)
+                reply = self.server.live.handle(msg)
+            except ValueError as e:
+                reply = {"ok": False, "error": str(e)}
+            self.wfile.write((json.dumps(reply)+"\n").encode())
+            if(isinstance(msg, dict) and msg.get("stop")):
+                self.server.shutdown()
+                return
+
+class _ControlServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+# Play a LiveSonifier and take control messages on host:port until told to stop (or interrupted)
+def serveLive(live, host=LIVE_HOST, port=LIVE_PORT):
+    with _ControlServer((host, port), _ControlHandler) as server:
+        server.live = live
+        engine = threading.Thread(target=live.run, daemon=True)
+        engine.start()
+        print("Playing, and listening for changes on "+host+":"+str(port))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            live.stop()
+            engine.join()
+
+
+# ---- The client side
+
+# Send a control message to a live server. Returns the reply, with how long it took to come back.
+def sendControl(msg, host=LIVE_HOST, port=LIVE_PORT):
+    _t0 = time.perf_counter()
+    with socket.create_connection((host, port), timeout=CONTROL_TIMEOUT+5) as sock:
+        sock.sendall((json.dumps(msg)+"\n").encode())
+        with sock.makefile("r") as f:
+            reply = json.loads(f.readline())
+    reply["roundTripSeconds"] = time.perf_counter() - _t0
+    return reply
+
+# Send a number of random changes, a little apart, and sum up how long they took to be heard
+def testControl(numChanges, host=LIVE_HOST, port=LIVE_PORT, pause=0.25, seed=None):
+    rng = random.Random(seed)
+    latency = []
+    failed = 0
+    for i in range(0, numChanges):
+        _lo = rng.uniform(20, 500)
+        changes = rng.choice([{"position": rng.random()},
+                              {"freqMinHz": _lo, "freqMaxHz": _lo + rng.uniform(500, 4000)},
+                              {"flipFreq": rng.random() < 0.5},
+                              {"direction": rng.choice(LIVE_DIRECTIONS)}])
+        reply = sendControl({"set": changes}, host, port)
+        if(reply.get("ok")):
+            latency.append(reply["latencySeconds"])
+            print("  {:3d} {:50s} {:7.1f}ms".format(i+1, json.dumps(changes), 1000*reply["latencySeconds"]))
+        else:
+            failed += 1
+            print("  {:3d} {:50s} {}".format(i+1, json.dumps(changes), reply.get("error")))
+        time.sleep(pause)
+
+    res = {"changes": numChanges, "failed": failed}
+    if(latency):
+        res.update(latencyMeanSeconds=statistics.mean(latency), latencyMaxSeconds=max(latency),
+                   latencyMinSeconds=min(latency))
+    return res
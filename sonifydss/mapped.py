@@ -0,0 +1,219 @@
+"""
+Sonifying FITS images too big to read into memory (--fitsfiles), e.g. 10k x 10k mosaics.
+
+The images are memory mapped (astropy.io.fits with memmap=True) rather than read in, and the
+median to subtract from them is found from a regular grid of about MEDIAN_SAMPLES of their pixels.
+The sweeps then get "rows" that look enough like the (channels, partials, points) arrays the
+synthesis engines work with: slicing them reads (and median subtracts) just the pixels in that
+slice, so each block of sound only reads the bit of every row (or column, or ring) it passes over.
+
+    imgs = openMapped(["red.fits", "blue.fits"], imgpars)
+    rows = stackRows(imgs)             # Nothing read yet
+    block = rows[:, 0:64, 100:108]     # Just these pixels read, as an ordinary array
+
+The rows can only be sliced (rows[:, p:q, a:b]); anything that needs a whole array of them
+(np.asarray, e.g. for --workers) reads them all in.
+"""
+
+import copy
+import math
+
+import numpy as np
+
+from sonifydss.sampling import pathIndex, radialGeometry, ringPath, sampleRings
+from sonifydss.profiling import stage
+
+# Number of pixels the median is found from, the rows read at a time when a whole image is
+# read in, and the columns of every row read at a time by a left-to-right sweep
+MEDIAN_SAMPLES = 1000000
+MAP_CHUNK_ROWS = 256
+MAP_PANEL_COLUMNS = 2048
+
+
+# ---- Memory mapped images
+
+# The median of raw pixel values from every step'th pixel of every step'th row, with the step
+# chosen so there are about samples of them. Only those rows are read.
+def sampledMedian(raw, samples=MEDIAN_SAMPLES):
+    step = max(1, math.ceil(math.sqrt(raw.size / samples)))
+    with stage("median", raw[::step, ::step].size):
+        return float(np.median(raw[::step, ::step]))
+
+# The first image in a FITS file, memory mapped. Slicing it (img[a:b, c:d]) reads just those
+# pixels, scaled (BSCALE and BZERO), less the median and clipped at zero as getDSSdata() does.
+class MappedImage:
+
+    def __init__(self, filename, medianSubtract=True):
+        from astropy.io import fits
+        # Scaling the data would read it all in, so it is scaled a slice at a time instead
+        self.filename = filename
+        self.hdul = fits.open(filename, memmap=True, do_not_scale_image_data=True)
+        hdu = next((h for h in self.hdul if h.is_image and h.header.get("NAXIS", 0) == 2), None)
+        if(hdu is None):
+            raise ValueError("No 2D image in "+filename)
+        self.raw = hdu.data
+        self.flat = self.raw.reshape(-1)
+        self.scale = float(hdu.header.get("BSCALE", 1.0))
+        self.zero = float(hdu.header.get("BZERO", 0.0))
+        self.shape = self.raw.shape
+        self.ndim = 2
+        self.dtype = np.dtype(float)
+        self.median = None
+        if(medianSubtract):
+            self.median = sampledMedian(self.raw) * self.scale + self.zero
+
+    # Pixel values from raw ones (always a new array)
+    def pixels(self, raw):
+        vals = np.array(raw, float)
+        if(self.scale != 1.0):
+            vals *= self.scale
+        if(self.zero != 0.0):
+            vals += self.zero
+        if(self.median is not None):
+            vals -= self.median
+            np.clip(vals, 0.0, None, out=vals)
+        return vals
+
+    def __getitem__(self, key):
+        return self.pixels(self.raw[key])
+
+    # The pixels at the given flat indices (any shape)
+    def take(self, idx):
+        return self.pixels(self.flat[idx])
+
+    # The whole image, read in MAP_CHUNK_ROWS at a time (e.g. for pictures)
+    def __array__(self, dtype=None, copy=None):
+        img = np.empty(self.shape, dtype or float)
+        for r in range(0, self.shape[0], MAP_CHUNK_ROWS):
+            img[r:r+MAP_CHUNK_ROWS] = self[r:r+MAP_CHUNK_ROWS]
+        return img
+
+# Memory map local FITS files as the images of a field, as getDSSdata() returns them (a list, one
+# image for each file)
+def openMapped(filenames, imgpars):
+    imgs = [MappedImage(f, imgpars["medianSubtract"]) for f in filenames]
+    if(any(img.shape != imgs[0].shape for img in imgs)):
+        raise ValueError("The FITS images are different sizes: "+", ".join(str(img.shape) for img in imgs))
+    return imgs
+
+def isMapped(img):
+    return isinstance(img, MappedImage)
+
+
+# ---- Rows read from them as they are needed
+
+# What all the rows read from mapped images have in common: subclasses say how to read
+# channels cs (a slice), partials p0 to p1 and points k0 to k1 as a new float array
+class LazyRows:
+
+    def __init__(self, imgs, shape):
+        self.imgs = list(imgs)
+        self.shape = (len(self.imgs),) + tuple(shape)
+        self.ndim = 3
+        self.dtype = np.dtype(float)
+        self.offsets = None
+
+    def _read(self, cs, p0, p1, k0, k1):
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        if(not isinstance(key, tuple)):
+            key = (key,)
+        if(len(key) > 3 or not all(isinstance(k, slice) and k.step in (None, 1) for k in key)):
+            raise IndexError("Rows read from mapped images can only be sliced, e.g. rows[:, p:q, a:b]")
+        cs, ps, ks = key + (slice(None),) * (3 - len(key))
+        p0, p1, _ = ps.indices(self.shape[1])
+        k0, k1, _ = ks.indices(self.shape[2])
+        vals = self._read(cs, p0, max(p0, p1), k0, max(k0, k1))
+        if(self.offsets is not None):
+            vals -= self.offsets[cs, p0:p1]
+        return vals.astype(self.dtype, copy=False)
+
+    def _clone(self):
+        return copy.copy(self)
+
+    # The same rows, read in as dtype
+    def astype(self, dtype, copy=True):
+        rows = self._clone()
+        rows.dtype = np.dtype(dtype)
+        return rows
+
+    # The same rows less m, (channels, partials, 1), e.g. the lowest value of each
+    def __sub__(self, m):
+        rows = self._clone()
+        rows.offsets = np.asarray(m) if self.offsets is None else self.offsets + m
+        return rows
+
+    # All of them, read in
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:, :, :], dtype or self.dtype)
+
+# The rows (or, transposed, the columns) of mapped images, for left-to-right (top-to-bottom) sweeps
+class MappedRows(LazyRows):
+
+    def __init__(self, imgs, transpose=False):
+        _s = imgs[0].shape
+        super().__init__(imgs, _s[::-1] if transpose else _s)
+        self.transpose = transpose
+        self._panel = None
+
+    def _read(self, cs, p0, p1, k0, k1):
+        imgs = self.imgs[cs]
+        if(self.transpose):
+            # Each partial is a column, so a block of sound reads a few whole rows
+            return np.stack([img[k0:k1, p0:p1].T for img in imgs])
+        if(k1 - k0 > MAP_PANEL_COLUMNS // 2):
+            return np.stack([img[p0:p1, k0:k1] for img in imgs])
+
+        # Each partial is a row, and a block of sound reads a few pixels from every one of them.
+        # Reading those straight from the file would read each page of it over and over, so the
+        # rows are read MAP_PANEL_COLUMNS at a time (as raw pixels, in either direction) and kept.
+        if(self._panel is None or k0 < self._panel[0] or k1 > self._panel[0] + MAP_PANEL_COLUMNS):
+            _c = max(0, min(k0 // (MAP_PANEL_COLUMNS // 2) * (MAP_PANEL_COLUMNS // 2), self.shape[2] - MAP_PANEL_COLUMNS))
+            self._panel = (_c, [np.array(img.raw[:, _c:_c+MAP_PANEL_COLUMNS]) for img in self.imgs])
+        _c, panels = self._panel
+        return np.stack([img.pixels(panel[p0:p1, k0-_c:k1-_c]) for img, panel in zip(self.imgs[cs], panels[cs])])
+
+# The rings around the middle of mapped images, for radial sweeps (as sampleRings() gathers them)
+class MappedRings(LazyRows):
+
+    def __init__(self, imgs, bilinear=False):
+        _, _, numSnds, numPts = radialGeometry(imgs[0].shape)
+        super().__init__(imgs, (numSnds, numPts))
+        self.bilinear = bilinear
+
+    def _read(self, cs, p0, p1, k0, k1):
+        xs, ys = ringPath(self.imgs[0].shape, p0, p1, k0, k1)
+        idx, wts = pathIndex(xs, ys, self.imgs[0].shape, self.bilinear)
+        if(idx.shape[0] == 1):
+            return np.stack([img.take(idx[0]) for img in self.imgs[cs]])
+        return np.stack([np.sum(img.take(idx) * wts, axis=0) for img in self.imgs[cs]])
+
+
+# ---- What the sweeps use
+
+# The rows (or, transposed, columns) of a stack of images as (channels, partials, points)
+def stackRows(imgs, transpose=False):
+    if(all(isMapped(img) for img in imgs)):
+        return MappedRows(imgs, transpose)
+    if(transpose):
+        return np.stack([img.T for img in imgs])
+    return np.stack(imgs)
+
+# The rings of a stack of images as (channels, rings, points)
+def ringRows(imgs, bilinear=False):
+    if(all(isMapped(img) for img in imgs)):
+        return MappedRings(imgs, bilinear)
+    return sampleRings(np.stack(imgs), bilinear)
+
+# An image in the given precision, left alone if it is mapped (its rows are read in that precision instead)
+def asImage(img, dtype):
+    if(isMapped(img)):
+        return img
+    return np.asarray(img, dtype)
+
+# Rows as an array (or mapped rows) of the given precision
+def asRows(rows, dtype):
+    if(isinstance(rows, LazyRows)):
+        return rows.astype(dtype, copy=False)
+    return np.asarray(rows, dtype)
@@ -0,0 +1,147 @@
+"""
+Writing sounds out, either all at once or in blocks (so that nothing the length of the whole sound has
+to be held in memory), and playing them.
+
+The format of the output file comes from its name (.wav, .flac or anything else soundfile knows),
+and sndpars["sampleFormat"] picks 16 or 24 bit integer or 32 bit float samples. WAV files too big
+for the 4GB the WAV format can hold are written as RF64 instead. Every sound is scaled so that its
+loudest sample is at full scale: the peak is found a block at a time (without an abs() copy of the
+sound), and each block is only scaled, converted and interleaved as it is written. The loudest
+sample can be put below full scale instead with sndpars["gainDb"] (e.g. -3 for 3dB below).
+"""
+
+import numpy as np
+import soundfile as sf
+import tempfile
+import os
+
+from sonifydss.synth import makeProgressBar, synthDtype
+from sonifydss.profiling import stage
+
+# Number of samples scaled and written at a time, and read back at a time when converting to the final output
+WRITE_BLOCK_SAMPLES = 65536
+
+# The soundfile subtype, full scale value and bytes per sample of each output sample format.
+#   Full scale is one less than 2**15 (or 2**23), as +2**15 does not fit in 16 bits.
+SAMPLE_FORMATS = {"16": ("PCM_16", 2**15 - 1, 2), "24": ("PCM_24", 2**23 - 1, 3), "float": ("FLOAT", 1.0, 4)}
+
+# Largest file the WAV format can hold (its sizes are 32 bit), less some room for the header
+WAV_MAX_BYTES = 2**32 - 2**16
+
+
+# ---- Encoding
+
+# The soundfile format and subtype to write a sound with. Raises ValueError if the file type cannot
+# hold samples of that format.
+def soundFileFormat(filename, sampleFormat, numChan, lenSam):
+    subtype, _, _bytes = SAMPLE_FORMATS[sampleFormat]
+    fmt = os.path.splitext(filename)[1][1:].upper() or "WAV"
+    if(fmt == "WAV" and lenSam * numChan * _bytes > WAV_MAX_BYTES):
+        fmt = "RF64"
+    if(not sf.check_format(fmt, subtype)):
+        raise ValueError(fmt+" files cannot hold "+sampleFormat+" samples")
+    return fmt, subtype
+
+# The loudest sample of a block (or whole sound), without making a copy of it
+def blockPeak(block):
+    if(block.size == 0):
+        return 0.0
+    return max(float(np.amax(block)), -float(np.amin(block)))
+
+# What to multiply a sound with the given peak by to bring it to full scale (1)
+def peakGain(peak):
+    return 1.0 / peak if peak > 0 else 0.0
+
+# Scale a (channels, samples) block and convert it to (samples, channels) of the output sample format
+def encodeBlock(block, gain, sampleFormat):
+    _, full, _ = SAMPLE_FORMATS[sampleFormat]
+    snd = block.T * (full * gain)
+    if(sampleFormat == "float"):
+        return snd.astype(np.float32, copy=False)
+    if(sampleFormat == "16"):
+        return snd.astype(np.int16)
+    # soundfile takes 32 bit integers as they are, so the 24 bits go at the top
+    return np.left_shift(snd.astype(np.int32), 8)
+
+# What to multiply the sound by on top of normalising it: the output gain in sndpars (in dB)
+def outputGain(sndpars):
+    return 10.0 ** (sndpars.get("gainDb", 0.0) / 20.0)
+
+# Write blocks of sound to the output file, scaled by gain (and the output gain)
+#   blocks: (first sample, block) pairs with block (channels, samples in block), in order
+def writeBlocks(blocks, numChan, gain, sndpars):
+    gain = gain * outputGain(sndpars)
+    sampleFormat = sndpars.get("sampleFormat", "16")
+    fmt, subtype = soundFileFormat(sndpars["filename"], sampleFormat, numChan, sndpars["soundLenSam"])
+    with sf.SoundFile(sndpars["filename"], 'w', samplerate=sndpars["sampleRate"], channels=numChan,
+                      format=fmt, subtype=subtype) as out:
+        for _, block in blocks:
+            with stage("encode", block.shape[1]):
+                out.write(encodeBlock(block, gain, sampleFormat))
+
+# A sound (channels, samples) in blocks of WRITE_BLOCK_SAMPLES
+def channelBlocks(sound):
+    for s in range(0, sound.shape[1], WRITE_BLOCK_SAMPLES):
+        yield s, sound[:, s:s+WRITE_BLOCK_SAMPLES]
+
+
+# ---- Writing
+
+# Write blocks of sound to the output file, normalised as writeSound() does.
+#   blocks: (first sample, block) pairs with block (channels, samples in block), in order
+# The normalisation depends on the loudest sample of the whole sound, so this takes two passes:
+# the blocks go into a temporary file (next to the output) while the peak is tracked, then they
+# are read back, scaled and appended to the output file.
+def writeSoundStream(blocks, numChan, sndpars, progress=True):
+    lenSam = sndpars["soundLenSam"]
+    tmpdir = os.path.dirname(os.path.abspath(sndpars["filename"]))
+    dtype = synthDtype(sndpars)
+
+    with tempfile.TemporaryFile(dir=tmpdir) as tmp:
+        # First pass: generate the sound and find its peak
+        _max = 0.0
+        if(progress):
+            pbar = makeProgressBar(lenSam)
+        for s, block in blocks:
+            with stage("normalise", block.shape[1]):
+                _max = max(_max, blockPeak(block))
+                tmp.write(np.ascontiguousarray(block.T, dtype=dtype).tobytes())
+            if(progress):
+                pbar.update(s+block.shape[1])
+
+        # Second pass: normalise and write
+        tmp.seek(0)
+
+        def _readBack():
+            s = 0
+            while True:
+                _buf = tmp.read(WRITE_BLOCK_SAMPLES * numChan * dtype.itemsize)
+                if(len(_buf) == 0):
+                    return
+                snd = np.frombuffer(_buf, dtype=dtype).reshape(-1, numChan).T
+                yield s, snd
+                s += snd.shape[1]
+
+        writeBlocks(_readBack(), numChan, peakGain(_max), sndpars)
+
+
+# Write the sound (channels, samples) out to a WAV (or FLAC, ...)
+def writeSound(sound, sndpars):
+
+    # Normalise the sound to full scale, using the loudest sample of any channel
+    with stage("normalise", sound.shape[1]):
+        _gain = peakGain(blockPeak(sound))
+    writeBlocks(channelBlocks(sound), sound.shape[0], _gain, sndpars)
+
+# Play the sound (channels, samples)
+def playSound(sound, sndpars):
+
+    # Normalise the sound to half of full scale, straight into the (samples, channels) layout
+    # the sound device wants
+    _gain = 0.5 * peakGain(blockPeak(sound))
+    sound = np.multiply(sound.T, _gain, out=np.empty(sound.shape[::-1], np.float32))
+
+    # Only look for a sound device when there is something to play
+    import sounddevice as sd
+    sd.play(sound, sndpars["sampleRate"])
+    sd.wait()  # Wait until file is done playing
@@ -0,0 +1,58 @@
+"""
+Placing each partial by where its pixels are in the image (--pan), rather than each image.
+
+For the left-to-right and top-to-bottom sweeps each partial is put at its place along the sweep
+line, spread across the front from the first row (or column) on the left to the last on the right,
+as imageAzimuths() spreads the images. For the radial sweep every ring is at the same place, so
+the sound follows the angle of the sweep line around the middle of the image instead (the top of
+the image straight ahead, the right of it to the right).
+
+The images are added up and multiplied by the (output channels, partials, points) gains of
+directionGains() for the layout, so the rows come out as (output channels, partials, points) and
+are generated just as any other rows are: the sum over the partials that makes every block is then
+the matrix product with the gains, and nothing is left to mix afterwards.
+
+    rows = panRows(rows, panGains(rows.shape, "TB", "stereo"))   # (2 images, ...) -> (2 channels, ...)
+"""
+
+import numpy as np
+
+from sonifydss.mapped import LazyRows
+from sonifydss.channels import directionGains, imageAzimuths
+
+
+# The azimuth of each partial, (partials, 1), or for radial sweeps of each point around the
+# rings, (1, points)
+def panAzimuths(numSnds, numPts, sweepDirn):
+    if(sweepDirn == "RAD"):
+        # The points go around from the right of the image (see sonifydss.sampling.ringPath),
+        # and the rows of the image go down
+        ang = 2 * np.pi * np.arange(0, numPts) / numPts
+        return np.arctan2(-np.cos(ang), -np.sin(ang))[np.newaxis, :]
+    return imageAzimuths(numSnds)[:, np.newaxis]
+
+# The gains (output channels, partials or 1, points or 1) for rows of the given shape
+def panGains(shape, sweepDirn, layout="stereo"):
+    return directionGains(panAzimuths(shape[1], shape[2], sweepDirn), layout)
+
+# Panned rows read from rows that are themselves read as they are needed (see sonifydss.mapped)
+class PannedRows(LazyRows):
+
+    def __init__(self, rows, gains):
+        super().__init__(rows.imgs, rows.shape[1:])
+        self.shape = (gains.shape[0],) + tuple(rows.shape[1:])
+        self.rows = rows
+        self.gains = gains
+
+    def _read(self, cs, p0, p1, k0, k1):
+        # The gains are the same for every point (or every partial) along a dimension of one
+        _ps = slice(p0, p1) if self.gains.shape[1] > 1 else slice(None)
+        _ks = slice(k0, k1) if self.gains.shape[2] > 1 else slice(None)
+        return self.gains[cs, _ps, _ks] * np.sum(self.rows[:, p0:p1, k0:k1], axis=0)
+
+# The rows (images, partials, points) added up and placed in the output channels with gains
+# (output channels, partials or 1, points or 1), as (output channels, partials, points)
+def panRows(rows, gains):
+    if(isinstance(rows, LazyRows)):
+        return PannedRows(rows, gains)
+    return (gains * np.sum(rows, axis=0)).astype(rows.dtype, copy=False)
@@ -0,0 +1,110 @@
+"""
+Rendering the partials on several cores at once (--workers).
+
+The partials are split into the same blocks of BLOCK_PARTIALS that synthBlocks() uses, and a
+pool of worker processes renders (partial block, stretch of time) pieces of the sound. Each
+partial block has its own slot in a shared-memory accumulation buffer, and the slots are added
+up in partial block order once a stretch of time is finished. That is exactly the sequence of
+additions synthBlocks() does, so the result is bit-for-bit the same as a single process run with
+the same phases. (With the phasor oscillators each piece starts its phasors afresh, so the result
+is only the same to within the phasors' drift, see synth.phasorDrift().)
+"""
+
+import numpy as np
+import math
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+from sonifydss.synth import BLOCK_PARTIALS, blockLength, envelopeMin, partialOmegas, partialBlock, synthDtype, sumBlocks, makeOscillator
+
+# Number of time blocks in each piece of work handed to a worker
+TASK_BLOCKS = 8
+
+# Things each worker process keeps between pieces of work
+_worker = {}
+
+
+# ---- Worker side
+
+# Attach to the shared rows and accumulation buffer
+def _initWorker(rowsName, rowsShape, accName, accShape, omega, phase0, sndpars):
+    _worker["rowsShm"] = shared_memory.SharedMemory(name=rowsName)
+    _worker["rows"] = np.ndarray(rowsShape, dtype=synthDtype(sndpars), buffer=_worker["rowsShm"].buf)
+    _worker["accShm"] = shared_memory.SharedMemory(name=accName)
+    _worker["acc"] = np.ndarray(accShape, dtype=synthDtype(sndpars), buffer=_worker["accShm"].buf)
+    _worker["omega"] = omega
+    _worker["phase0"] = phase0
+    _worker["sndpars"] = sndpars
+
+# Render one partial block for one stretch of time, one time block at a time as synthBlocks()
+# does, into its slot in the accumulation buffer
+def _renderTask(task):
+    g, s0, s1, blkLen, off = task
+    rows = _worker["rows"]
+    sndpars = _worker["sndpars"]
+    p = g * BLOCK_PARTIALS
+    q = min(p + BLOCK_PARTIALS, rows.shape[1])
+    osc = makeOscillator(_worker["omega"][p:q], _worker["phase0"][p:q], s0, sndpars)
+    for s in range(s0, s1, blkLen):
+        e = min(s + blkLen, s1)
+        if(osc is None):
+            _worker["acc"][g, :, s-off:e-off] = partialBlock(rows, _worker["omega"], _worker["phase0"], p, q, s, e, sndpars)
+        else:
+            _worker["acc"][g, :, s-off:e-off] = partialBlock(rows[:, p:q], _worker["omega"][p:q], _worker["phase0"][p:q], 0, q-p, s, e, sndpars, osc)
+            osc.advance(e-s)
+    return s1 - s0
+
+
+# ---- Parent side
+
+# Start method for the worker processes. Forking avoids re-running the calling script in each
+# worker, so use it wherever it is available.
+def processContext():
+    if("fork" in mp.get_all_start_methods()):
+        return mp.get_context("fork")
+    return mp.get_context()
+
+# Generate the sound in time blocks, as synthBlocks() does, using sndpars["workers"] processes
+def parallelBlocks(rows, freqs, phs, sndpars):
+    numChan, numSnds, numPts = rows.shape
+    lenSam = sndpars["soundLenSam"]
+    workers = sndpars["workers"]
+    blkLen = blockLength(numPts, sndpars)
+    numGrp = math.ceil(numSnds / BLOCK_PARTIALS)
+    dtype = synthDtype(sndpars)
+    rows = np.asarray(rows, dtype)
+
+    if(sndpars["minSubtract"]):
+        rows = rows - envelopeMin(rows, sndpars)
+    omega, phase0 = partialOmegas(freqs, phs)
+
+    # Each stretch of time handed out covers TASK_BLOCKS time blocks, and enough stretches are
+    # rendered together to give every worker a couple of pieces of work
+    taskLen = TASK_BLOCKS * blkLen
+    numSpan = max(1, math.ceil(2 * workers / numGrp))
+    winLen = min(numSpan * taskLen, math.ceil(lenSam / blkLen) * blkLen)
+
+    rowsShm = shared_memory.SharedMemory(create=True, size=max(1, rows.size * dtype.itemsize))
+    accShm = shared_memory.SharedMemory(create=True, size=max(1, numGrp * numChan * winLen * dtype.itemsize))
+    try:
+        _rows = np.ndarray(rows.shape, dtype=dtype, buffer=rowsShm.buf)
+        _rows[:] = rows
+        acc = np.ndarray((numGrp, numChan, winLen), dtype=dtype, buffer=accShm.buf)
+
+        with processContext().Pool(workers, initializer=_initWorker,
+                             initargs=(rowsShm.name, rows.shape, accShm.name, acc.shape, omega, phase0, sndpars)) as pool:
+            for w in range(0, lenSam, winLen):
+                we = min(w + winLen, lenSam)
+                tasks = [(g, s0, min(s0 + taskLen, we), blkLen, w)
+                         for s0 in range(w, we, taskLen) for g in range(0, numGrp)]
+                for _ in pool.imap_unordered(_renderTask, tasks):
+                    pass
+
+                # Add the partial blocks up in the same order as synthBlocks()
+                block = sumBlocks((acc[g, :, :we-w] for g in range(0, numGrp)), (numChan, we-w), dtype)
+                yield w, block
+    finally:
+        rowsShm.close()
+        rowsShm.unlink()
+        accShm.close()
+        accShm.unlink()
@@ -0,0 +1,341 @@
+"""
+Pictures and movies of the DSS images. Matplotlib is only imported when a picture or movie is
+actually made.
+"""
+
+import numpy as np
+import math
+import os
+import tempfile
+
+from sonifydss.profiling import stage, profiledIter
+from sonifydss.synth import makeProgressBar
+
+
+# ==== Function to make RGB from DSS data
+def DSS2RGB(*imgs):
+
+    # RGB:
+    #   * R and B are SQRT scaled from the first and last images (e.g. DSS2 Red and Blue)
+    #   * G is the average of any images in between, or of R and B if there are none
+    #     (and with just one image all three are the same, so it is grey)
+    _s = []
+    for img in imgs:
+        _i = np.sqrt((img - (np.min(img))))
+        _s.append(_i / np.max(_i))
+    _r = _s[0]
+    _b = _s[-1]
+    _g = 0.5 * (_r + _b) if len(_s) < 3 else np.mean(_s[1:-1], axis=0)
+
+    return np.dstack((_r, _g, _b))
+
+# The colour map each image is shown in: red for the first, blue for the last and green in between
+def imageCmaps(numImgs):
+    if(numImgs == 1):
+        return ['Greys_r']
+    return ['Reds_r'] + ['Greens_r'] * (numImgs-2) + ['Blues_r']
+
+# ---- Make a picture of the images and a colour version, with the colour version in the middle
+#   titles: a title for each image, e.g. 'DSS2 Red: Left channel'
+#   name: what the colour version is made of, e.g. 'DSS2 Red+Blue'
+def makePicture(imgs, imgRGB, picfil, titles, name):
+    import matplotlib.pyplot as plt
+
+    numImgs = len(imgs)
+    f, axarr = plt.subplots(1,numImgs+1,figsize=(5*(numImgs+1),5))
+    _c = numImgs // 2
+    axarr[_c].imshow(imgRGB)
+    axarr[_c].set_title(name+' colour')
+    for k, (img, cmap) in enumerate(zip(imgs, imageCmaps(numImgs))):
+        _ax = axarr[k + (k >= _c)]
+        _ax.imshow(img,origin='upper',interpolation='none',cmap=cmap)
+        _ax.set_title(titles[k])
+
+    plt.savefig(picfil, bbox_inches='tight')
+    plt.close(f)
+
+# ---- Movies of the "sweep"
+# The background (the colour image on its axes) is drawn by matplotlib just once. The sweep line
+# for each frame is then drawn straight into a copy of it, and the frames are piped as raw pixels
+# to a single ffmpeg process, which adds the sound at the same time.
+
+# Default frames per second and resolution of the movie (an 8x8 inch figure). These can be
+# changed with sndpars["movieFps"] and sndpars["movieDpi"].
+MOVIE_FPS = 24
+MOVIE_DPI = 100
+MOVIE_INCHES = 8
+
+# With sndpars["movieWorkers"] > 1 the frames are split into this many segments per worker,
+# each rendered and encoded separately, then joined
+SEGMENTS_PER_WORKER = 2
+
+# What each worker process needs to render its segments
+_movieWorker = {}
+
+# The end points (in image coordinates) of the "sweep" line for frame i of numfrms
+def sweepLine(i, numfrms, shape, dirn, flip):
+    x = []
+    y = []
+    if dirn == "LR":
+        # Sweep left-to-right (or reverse)
+        _x = shape[0] * (i/numfrms)
+        if(flip):
+            _x = (shape[0]-1) - _x
+        x = [_x, _x]
+        y = [1, shape[1]-1]
+    elif dirn == "TB":
+        # Sweep to-to-bottom (or reverse)
+        x = [1, shape[0]-1]
+        _y = shape[1] * (i/numfrms)
+        if(flip):
+            _y = (shape[1]-1) - _y
+        y = [_y, _y]
+    elif dirn == "RAD":
+        # Sweep in a circle
+        _x1 = shape[0]/2
+        _y1 = shape[1]/2
+        rad = math.floor(_x1-1) if (_x1<_y1) else math.floor(_y1-1)
+        ang = 2 * math.pi * i/numfrms
+        if(flip):
+            ang = (2 * math.pi) - ang
+        _x2 = round(_x1 + (rad * math.cos(ang)))
+        _y2 = round(_y1 + (rad * math.sin(ang)))
+
+        x = [_x1, _x2]
+        y = [_y1, _y2]
+    return x, y
+
+# The background of every frame: the colour image on a set of axes, as (rows, columns, RGB) bytes,
+# along with the transform from image to display coordinates and the part of the frame the axes
+# cover. The frame of the axes is drawn over the sweep line, so the background is without it and
+# the frame is the pixels it covers and how much it darkens each of them.
+def movieBackground(imgRGB, dpi=MOVIE_DPI):
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(MOVIE_INCHES, MOVIE_INCHES), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    im = ax.imshow(imgRGB)
+
+    # How much the frame of the axes darkens each pixel: draw it with and without it, but without
+    # the image so that what it covers is always white
+    im.set_visible(False)
+    canvas.draw()
+    withFrame = np.asarray(canvas.buffer_rgba())[:, :, :3].astype(float)
+    for sp in ax.spines.values():
+        sp.set_visible(False)
+    canvas.draw()
+    noFrame = np.asarray(canvas.buffer_rgba())[:, :, :3].astype(float)
+    rows, cols = np.nonzero(np.any(withFrame != noFrame, axis=2))
+    keep = withFrame[rows, cols] / np.maximum(noFrame[rows, cols], 1)
+
+    # and the background without it
+    im.set_visible(True)
+    canvas.draw()
+    under = np.asarray(canvas.buffer_rgba())[:, :, :3].copy()
+    spines = (rows, cols, keep)
+
+    _h = under.shape[0]
+    _x0, _y0, _x1, _y1 = ax.bbox.extents
+    # Frame coordinates are (across, down) from the top left, rather than up from the bottom left
+    clip = (_x0, _h - _y1, _x1, _h - _y0)
+    return under, ax.transData.frozen(), clip, spines
+
+# Draw an (anti-aliased, square ended) line from p0 to p1 into a frame, as matplotlib would.
+#   p0, p1: (across, down) in pixels, width: in pixels, colour: RGB 0-1, alpha: opacity
+#   Only the pixels near the line are visited, a strip along whichever direction it runs most.
+#   Returns the (rows, columns) it changed.
+def drawLine(frame, p0, p1, width, colour, alpha, clip):
+    p0 = np.asarray(p0, float)
+    p1 = np.asarray(p1, float)
+    hw = width / 2
+    ext = hw + 1.0
+    d = p1 - p0
+    length = math.hypot(d[0], d[1])
+    u = d / length if length > 0 else np.array([1.0, 0.0])
+
+    # Along the main direction of the line, and the span either side of it that may be touched
+    ma = 0 if abs(d[0]) >= abs(d[1]) else 1
+    mi = 1 - ma
+    slope = d[mi] / d[ma] if d[ma] != 0 else 0.0
+    half = ext * math.sqrt(1 + slope*slope)
+    lim = (frame.shape[1], frame.shape[0])
+    m = np.arange(max(0, math.floor(min(p0[ma], p1[ma]) - ext)), min(lim[ma], math.ceil(max(p0[ma], p1[ma]) + ext)))
+    c = p0[mi] + (m + 0.5 - p0[ma]) * slope
+    n = np.floor(c - half).astype(int)[:, None] + np.arange(0, math.ceil(2*half) + 2)
+    m = np.broadcast_to(m[:, None], n.shape)
+    cols, rows = (m, n) if ma == 0 else (n, m)
+
+    # Only inside the frame and the axes
+    ok = ((cols >= 0) & (cols < lim[0]) & (rows >= 0) & (rows < lim[1]) &
+          (cols + 0.5 >= clip[0]) & (cols + 0.5 <= clip[2]) & (rows + 0.5 >= clip[1]) & (rows + 0.5 <= clip[3]))
+    cols = cols[ok]
+    rows = rows[ok]
+
+    # How much of each pixel the line covers
+    vx = cols + 0.5 - p0[0]
+    vy = rows + 0.5 - p0[1]
+    along = vx*u[0] + vy*u[1]
+    perp = np.abs(vx*u[1] - vy*u[0])
+    beyond = np.maximum(np.maximum(-along, along - length), 0.0)
+    cov = alpha * np.clip(hw + 0.5 - perp, 0, 1) * np.clip(hw + 0.5 - beyond, 0, 1)
+
+    _px = frame[rows, cols].astype(float)
+    _px += (255.0 * np.asarray(colour[:3], float) - _px) * cov[:, None]
+    frame[rows, cols] = np.rint(_px).astype(np.uint8)
+    return rows, cols
+
+# Line end points in frame coordinates from display coordinates (up from the bottom left). Like
+# matplotlib, lines that are exactly horizontal or vertical are snapped to the middle of a pixel
+# (or the edge, for lines an even number of pixels wide) so that they stay crisp.
+def snapLine(p, width, height):
+    p = np.array(p, float)
+    p[:, 1] = height - p[:, 1]
+    if(p[0, 0] == p[1, 0] or p[0, 1] == p[1, 1]):
+        p = np.floor(p + 0.5) + (0.5 if round(width) % 2 == 1 else 0.0)
+    return p
+
+# The frames from start to stop (of numfrms) of a movie of the sweep, as (rows, columns, RGB) bytes.
+# The same buffer is reused for every frame, so use (or copy) each before asking for the next.
+def movieFrames(imgRGB, sndpars, start, stop, numfrms, dpi=MOVIE_DPI):
+    from matplotlib import colormaps
+
+    bg, trans, clip, spines = movieBackground(imgRGB, dpi)
+    sr, sc, keep = spines
+    _h = bg.shape[0]
+    scale = dpi / 72    # Line widths are in points
+    highlight = (1.0, 1.0, 1.0)
+    hlAlpha = 0x11 / 0xff   # '#fff1'
+
+    # A line of green gradient to mark the higher (pale green) and lower (dark green)
+    _n = int(imgRGB.shape[0] / 4) if imgRGB.shape[0] < 128 else 32
+    # Don't use the full range of greens, just the middle bit (to avoid near-white and near-black)
+    _cols = colormaps['Greens'](np.linspace(0.3, 0.8, _n))
+    if(not sndpars['flipFreq']):
+        _cols = _cols[::-1][1:]
+
+    frame = bg.copy()
+    for i in range(start, stop):
+        x, y = sweepLine(i, numfrms, imgRGB.shape, sndpars["sweepDirn"], sndpars["flipDirn"])
+        _p = trans.transform(np.column_stack((x, y)))
+        _s = _p[0] + np.multiply.outer(np.linspace(0, 1, _n), _p[1] - _p[0])
+
+        touched = []
+        # A faint background "highlight" line
+        for w in (6*scale, 4*scale):
+            _q = snapLine(_p, w, _h)
+            touched.append(drawLine(frame, _q[0], _q[1], w, highlight, hlAlpha, clip))
+        # and the gradient on top of it
+        for j in range(_n - 1):
+            _q = snapLine(_s[j:j+2], 2*scale, _h)
+            touched.append(drawLine(frame, _q[0], _q[1], 2*scale, _cols[j], 1.0, clip))
+        # and the frame of the axes over everything
+        frame[sr, sc] = np.rint(frame[sr, sc] * keep).astype(np.uint8)
+        touched.append((sr, sc))
+
+        yield frame
+
+        # Put the background back where the lines were
+        for rows, cols in touched:
+            frame[rows, cols] = bg[rows, cols]
+
+# The ffmpeg programme: on the path, or the one that comes with imageio-ffmpeg (e.g. with moviepy)
+def ffmpegPath():
+    import shutil
+    _f = shutil.which("ffmpeg")
+    if(_f):
+        return _f
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except (ImportError, RuntimeError):
+        raise FileNotFoundError("Making movies needs ffmpeg (see https://ffmpeg.org/)")
+
+# Encode frames (and optionally a sound) with ffmpeg
+#   frames: (rows, columns, RGB) bytes, all the same size
+def encodeFrames(frames, fps, movfil, sndfil=None, pbar=None):
+    import subprocess
+    proc = None
+    try:
+        for k, frm in enumerate(frames):
+            if(proc is None):
+                cmd = [ffmpegPath(), "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+                       "-s", str(frm.shape[1])+"x"+str(frm.shape[0]), "-r", str(fps), "-i", "-"]
+                if(sndfil):
+                    cmd += ["-i", sndfil, "-c:a", "aac", "-shortest"]
+                cmd += ["-c:v", "libx264", "-pix_fmt", "yuv420p", movfil]
+                proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+            with stage("movie encode", 1):
+                proc.stdin.write(frm.tobytes())
+            if(pbar):
+                pbar.update(k)
+    finally:
+        if(proc is not None):
+            with stage("movie encode"):
+                proc.stdin.close()
+                _rc = proc.wait()
+            if(_rc != 0):
+                raise RuntimeError("ffmpeg failed making "+movfil)
+
+# Join encoded segments (without re-encoding them), adding the sound
+def concatSegments(segfils, movfil, sndfil=None):
+    import subprocess
+    listfil = os.path.join(os.path.dirname(segfils[0]), "segments.txt")
+    with open(listfil, "w") as f:
+        for seg in segfils:
+            f.write("file '" + seg.replace("'", "'\\''") + "'\n")
+
+    cmd = [ffmpegPath(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", listfil]
+    if(sndfil):
+        cmd += ["-i", sndfil, "-c:a", "aac", "-shortest"]
+    cmd += ["-c:v", "copy", movfil]
+    with stage("movie mux"):
+        _rc = subprocess.run(cmd).returncode
+    if(_rc != 0):
+        raise RuntimeError("ffmpeg failed joining the segments of "+movfil)
+
+def _initMovieWorker(imgRGB, sndpars, numfrms, fps, dpi):
+    _movieWorker.update(imgRGB=imgRGB, sndpars=sndpars, numfrms=numfrms, fps=fps, dpi=dpi)
+
+# Render and encode frames start to stop into their own file, in a worker process
+def _movieSegment(start, stop, segfil):
+    w = _movieWorker
+    encodeFrames(movieFrames(w["imgRGB"], w["sndpars"], start, stop, w["numfrms"], w["dpi"]), w["fps"], segfil)
+    return stop - start
+
+# --- Make a movie showing the "sweep" over the DSS colour image, with the sound.
+def makeMovie(imgRGB, sndpars, movfil, sndfil):
+
+    # Movie setup
+    fps = sndpars.get("movieFps", MOVIE_FPS)
+    dpi = sndpars.get("movieDpi", MOVIE_DPI)
+    workers = sndpars.get("movieWorkers", 1)
+    numsec = sndpars["soundLength"]
+    numfrms = int(fps * numsec)
+
+    pbar = makeProgressBar(numfrms)
+
+    numSeg = min(workers * SEGMENTS_PER_WORKER, numfrms // fps)
+    if(workers <= 1 or numSeg < 2):
+        # All in one go
+        encodeFrames(profiledIter(movieFrames(imgRGB, sndpars, 0, numfrms, numfrms, dpi), "movie frames", lambda _: 1),
+                     fps, movfil, sndfil, pbar)
+    else:
+        # Segments of (nearly) the same length, rendered and encoded on several processes,
+        # then joined with the sound
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        from sonifydss.parallel import processContext
+        bounds = np.linspace(0, numfrms, numSeg+1).astype(int)
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(movfil))) as tmpdir:
+            segfils = [os.path.join(tmpdir, "segment{:04d}.mp4".format(k)) for k in range(0, numSeg)]
+            with ProcessPoolExecutor(max_workers=workers, mp_context=processContext(), initializer=_initMovieWorker,
+                                     initargs=(imgRGB, sndpars, numfrms, fps, dpi)) as pool:
+                jobs = [pool.submit(_movieSegment, bounds[k], bounds[k+1], segfils[k]) for k in range(0, numSeg)]
+                done = 0
+                for job in as_completed(jobs):
+                    done += job.result()
+                    pbar.update(done-1)
+            concatSegments(segfils, movfil, sndfil)
+
+    pbar.update(numfrms-1)
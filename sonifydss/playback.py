@@ -0,0 +1,284 @@
+"""
+Playing a sound while it is being generated (--liveplay).
+
+The synthesis engine makes the sound a block at a time. Each block is scaled, handed to a ring
+buffer and passed on (so that it can be written out as well), while an audio output stream's
+callback takes the sound from the other end of the ring buffer as the device needs it. Only the
+generating thread moves the write position and only the callback moves the read position, so no
+locks are needed and the callback never has to wait. Sound starts as soon as the first block or
+two are ready, rather than when the whole sound has been generated and written.
+
+The whole sound has not been made when playing starts, so its peak is not known. It is scaled
+by playbackGain(), an estimate from the pixel values, and anything that would still be too loud
+is clipped (and counted).
+
+The output can be a sounddevice OutputStream or a NullSink, which calls the callback at the same
+pace as a real device would but throws the sound away, so all of this works without an audio device.
+"""
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from sonifydss.synth import envelopeMin
+from sonifydss.channels import channelMix
+
+# Samples the device is asked for at a time, how much sound the ring buffer holds, how much has
+# to be in it before playing starts (all in seconds) and how many times the typical level the
+# peak of the sound is taken to be
+PLAY_BLOCK_SAMPLES = 1024
+RING_SECONDS = 2.0
+PREFILL_SECONDS = 0.1
+PEAK_FACTOR = 4.0
+
+# Number of points along the rows looked at a time when estimating the peak
+GAIN_CHUNK_POINTS = 1024
+
+
+# ---- The ring buffer
+
+# A buffer of (frames, channels) samples for one thread to write to and another to read from
+class RingBuffer:
+
+    def __init__(self, frames, channels):
+        self.buf = np.zeros((frames, channels), np.float32)
+        self.size = frames
+        self.written = 0
+        self.read = 0
+
+    # Frames waiting to be read
+    def available(self):
+        return self.written - self.read
+
+    # Frames that can be written without overwriting any still to be read
+    def space(self):
+        return self.size - self.available()
+
+    # Copy as many (frames, channels) samples in as there is space for. Returns how many were.
+    def put(self, frames):
+        n = min(frames.shape[0], self.space())
+        _i = self.written % self.size
+        _n = min(n, self.size - _i)
+        self.buf[_i:_i+_n] = frames[:_n]
+        self.buf[:n-_n] = frames[_n:n]
+        self.written += n
+        return n
+
+    # Copy as many samples as are waiting (up to the length of out) into out. Returns how many were.
+    def get(self, out):
+        n = min(out.shape[0], self.available())
+        _i = self.read % self.size
+        _n = min(n, self.size - _i)
+        out[:_n] = self.buf[_i:_i+_n]
+        out[_n:n] = self.buf[:n-_n]
+        self.read += n
+        return n
+
+
+# ---- Where the sound goes
+
+# An output stream that plays to nowhere: it calls callback(outdata, frames, time, status) as a
+# sounddevice OutputStream would, every frames/sampleRate seconds
+class NullSink:
+
+    def __init__(self, samplerate, channels, blocksize, callback):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+        self.callback = callback
+        self.latency = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        out = np.zeros((self.blocksize, self.channels), np.float32)
+        _next = time.perf_counter()
+        while not self._stop.is_set():
+            self.callback(out, self.blocksize, None, None)
+            _next += self.blocksize / self.samplerate
+            self._stop.wait(max(0.0, _next - time.perf_counter()))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if(self._thread is not None):
+            self._thread.join()
+
+    def close(self):
+        self.stop()
+
+# An output stream for the device: "null" for a NullSink, otherwise a sounddevice OutputStream
+# on the given device (a name or number, or None for the default)
+def makeSink(device, samplerate, channels, blocksize, callback):
+    if(device == "null"):
+        return NullSink(samplerate, channels, blocksize, callback)
+    # Only look for a sound device when there is something to play
+    import sounddevice as sd
+    if(isinstance(device, str) and device.isdigit()):
+        device = int(device)
+    return sd.OutputStream(samplerate=samplerate, channels=channels, dtype="float32",
+                           blocksize=blocksize, device=device, callback=callback)
+
+
+# ---- Playing
+
+# How much to scale the sound by, without having made it, so that it (nearly always) fits in -1 to 1.
+#   The partials have random phases, so they mostly add up like noise: the typical level at any
+#   point is the root sum of squares of the envelopes there, and the peak is taken to be
+#   PEAK_FACTOR times the loudest of those. Each partial has the same phase in every image, so the
+#   envelopes are mixed to the output channels (sndpars["layout"]) before they are added up.
+def playbackGain(rows, sndpars):
+    if(sndpars["minSubtract"]):
+        rows = rows - envelopeMin(rows, sndpars)
+    mix = channelMix(rows.shape[0], sndpars)
+    _ss = 0.0
+    for k in range(0, rows.shape[2], GAIN_CHUNK_POINTS):
+        _r = rows[:, :, k:k+GAIN_CHUNK_POINTS]
+        if(mix is not None):
+            _r = np.tensordot(mix, _r, axes=1)
+        _ss = max(_ss, float(np.amax(np.sum(np.square(_r, dtype=float), axis=1))))
+    _rms = np.sqrt(_ss / 2)
+    return 1.0 / (PEAK_FACTOR * _rms) if _rms > 0 else 1.0
+
+# Plays blocks of sound as they are generated.
+#   player = StreamPlayer(outputChannels(len(imgs), sndpars), sndpars, gain, device="null")
+#   for s, block in player.play(blocks):
+#       ...   # e.g. write them out
+#   print(formatReport(player.report()))
+class StreamPlayer:
+
+    def __init__(self, numChan, sndpars, gain, device=None, ringSeconds=RING_SECONDS, prefillSeconds=PREFILL_SECONDS):
+        self.numChan = numChan
+        self.sndpars = sndpars
+        self.gain = gain
+        self.device = device
+        sr = sndpars["sampleRate"]
+        self.ring = RingBuffer(int(ringSeconds * sr), numChan)
+        self.prefill = min(int(prefillSeconds * sr), self.ring.size)
+        self._nextMarks = deque()
+        self.marks = deque()
+
+        self.finished = False
+        self.done = threading.Event()
+        self.stream = None
+        self.started = False
+        self._t0 = None
+        self.startSeconds = None
+        self.underruns = 0
+        self.underrunFrames = 0
+        self.statusFlags = 0
+        self.clipped = 0
+        self.blockSeconds = []
+        self.blockSamples = []
+
+    # The stream's callback: take the next frames from the ring buffer, or silence if there are none
+    def _callback(self, outdata, frames, time_, status):
+        if(status):
+            self.statusFlags += 1
+        n = self.ring.get(outdata)
+        if(n > 0 and self.startSeconds is None):
+            self.startSeconds = time.perf_counter() - self._t0
+        while self.marks and self.marks[0][0] < self.ring.read:
+            self.marks.popleft()[1](time.perf_counter())
+        if(n < frames):
+            outdata[n:] = 0
+            if(self.finished):
+                self.done.set()
+            else:
+                self.underruns += 1
+                self.underrunFrames += frames - n
+
+    # Call fn(time) (from the audio thread, so it should be quick) when the next block to be
+    # generated starts to play, with the time.perf_counter() it did
+    def markNext(self, fn):
+        self._nextMarks.append(fn)
+
+    def _start(self):
+        if(not self.started):
+            self.started = True
+            self.stream.start()
+
+    # Scale a (channels, samples) block and put it in the ring buffer, waiting for space if need be
+    def _push(self, block):
+        frames = np.asarray(block.T * self.gain, np.float32)
+        _over = np.abs(frames) > 1.0
+        if(np.any(_over)):
+            self.clipped += int(np.count_nonzero(_over))
+            np.clip(frames, -1.0, 1.0, out=frames)
+
+        while self._nextMarks:
+            self.marks.append((self.ring.written, self._nextMarks.popleft()))
+
+        _wait = PLAY_BLOCK_SAMPLES / self.sndpars["sampleRate"] / 2
+        while frames.shape[0] > 0:
+            n = self.ring.put(frames)
+            frames = frames[n:]
+            if(self.ring.available() >= self.prefill or self.ring.space() == 0):
+                self._start()
+            if(frames.shape[0] > 0):
+                time.sleep(_wait)
+
+    # Play the blocks, passing each one on once it is in the ring buffer, and return once all of
+    # the sound has been played.
+    #   blocks: (first sample, block) pairs with block (channels, samples in block), in order
+    def play(self, blocks):
+        self._t0 = time.perf_counter()
+        self.stream = makeSink(self.device, self.sndpars["sampleRate"], self.numChan, PLAY_BLOCK_SAMPLES, self._callback)
+        blocks = iter(blocks)
+        try:
+            while True:
+                _t = time.perf_counter()
+                try:
+                    s, block = next(blocks)
+                except StopIteration:
+                    break
+                self.blockSeconds.append(time.perf_counter() - _t)
+                self.blockSamples.append(block.shape[1])
+                self._push(block)
+                yield s, block
+
+            # Play whatever is left
+            self.finished = True
+            self._start()
+            self.done.wait()
+        finally:
+            self.stream.stop()
+            self.stream.close()
+
+    # How it went: how long it took for sound to start, how long each block took to generate
+    # compared with how long it lasts, and how many times (and for how many samples) the
+    # device ran out of sound
+    def report(self):
+        sr = self.sndpars["sampleRate"]
+        _gen = sum(self.blockSeconds)
+        _snd = sum(self.blockSamples) / sr
+        return {
+            "startSeconds": self.startSeconds,
+            "blocks": len(self.blockSeconds),
+            "blockSecondsMean": _gen / len(self.blockSeconds) if self.blockSeconds else None,
+            "blockSecondsMax": max(self.blockSeconds) if self.blockSeconds else None,
+            "realTimeFactor": _snd / _gen if _gen > 0 else None,
+            "underruns": self.underruns,
+            "underrunSeconds": self.underrunFrames / sr,
+            "deviceStatusFlags": self.statusFlags,
+            "clippedSamples": self.clipped,
+            "deviceLatency": getattr(self.stream, "latency", None)
+        }
+
+# A report from StreamPlayer.report() as a few lines of text
+def formatReport(report):
+    lines = []
+    if(report["startSeconds"] is not None):
+        lines.append("Sound started after {:.3f}s".format(report["startSeconds"]))
+    if(report["blocks"] > 0):
+        lines.append("Generated {} blocks, {:.1f}ms each on average ({:.1f}ms at most), {:.1f}x as fast as real time".format(
+            report["blocks"], 1000*report["blockSecondsMean"], 1000*report["blockSecondsMax"], report["realTimeFactor"] or 0.0))
+    lines.append("Underruns: {} ({:.3f}s of silence)".format(report["underruns"], report["underrunSeconds"]))
+    if(report["clippedSamples"] > 0):
+        lines.append("Clipped samples: {}".format(report["clippedSamples"]))
+    return "\n".join(lines)
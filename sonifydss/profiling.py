@@ -0,0 +1,241 @@
+"""
+Timing the stages of a sonification (--profile).
+
+Anything can time a stage of its work with
+
+    with stage("encode", samples=n):
+        ...
+
+which costs next to nothing unless something is listening. The listeners ("hooks") are functions
+given an event for every stage as it finishes:
+
+    {"stage": "encode", "start": perf_counter() at the start, "wall": seconds, "cpu": seconds,
+     "maxRssMB": peak memory so far, "samples": n, "weight": 1, "thread": thread id}
+
+    addHook(print)          # or any other function
+    ...
+    removeHook(print)
+
+Profiler is a hook that keeps the events and sums them up per stage, as JSON or as a Chrome trace
+(for chrome://tracing or https://ui.perfetto.dev). Stages that happen very many times, like the
+oscillators of each block of partials, are only timed one time in PROFILE_EVERY and count for
+PROFILE_EVERY of them ("weight"), which keeps the cost of profiling well under 1%. The one timed is
+picked at random from each PROFILE_EVERY in turn, so a stage that goes round a few kinds of work
+(e.g. the blocks of partials of each time block) is not always timed on the same one.
+
+CPU time is that of the whole process, so it includes the threads numpy uses (and anything else
+running at the same time), and memory is the peak resident size of the process so far. Stages
+run in other processes (--workers, --movie-workers) are only seen as a whole.
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# One in how many of the stages that happen very many times is timed
+PROFILE_EVERY = 16
+
+_hooks = []
+
+
+# ---- Hooks
+
+# Call fn(event) for every stage from now on
+def addHook(fn):
+    _hooks.append(fn)
+
+def removeHook(fn):
+    if(fn in _hooks):
+        _hooks.remove(fn)
+
+# The peak resident memory of the process so far, in MB (or None if it cannot be found)
+def maxRssMB():
+    if(resource is None):
+        return None
+    _rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives KB, macOS bytes
+    return _rss / (1024*1024 if sys.platform == "darwin" else 1024)
+
+
+# ---- Stages
+
+class _Stage:
+
+    def __init__(self, name, samples=None, weight=1):
+        self.name = name
+        self.samples = samples
+        self.weight = weight
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        event = {"stage": self.name, "start": self.start, "wall": time.perf_counter() - self.start,
+                 "cpu": time.process_time() - self.cpu, "maxRssMB": maxRssMB(), "samples": self.samples,
+                 "weight": self.weight, "thread": threading.get_ident()}
+        for hook in list(_hooks):
+            hook(event)
+        return False
+
+# What stage() gives when nobody is listening
+class _NoStage:
+    samples = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_STAGE = _NoStage()
+
+# Time the work in a with block as a stage.
+#   samples: how many samples (of sound, or partials times samples, or frames) it handles,
+#   if that means anything, for samples per second. It can also be set on what this returns
+#   inside the block (with stage(...) as st: ... st.samples = n).
+def stage(name, samples=None):
+    if(not _hooks):
+        return _NO_STAGE
+    return _Stage(name, samples)
+
+# As stage(), for stages that happen very many times: only one in PROFILE_EVERY is timed (as the
+# Profiler listening picks them; with only other hooks listening every one is)
+def sampledStage(name, samples=None):
+    if(not _hooks):
+        return _NO_STAGE
+    prof = next((hook for hook in _hooks if isinstance(hook, Profiler)), None)
+    if(prof is None):
+        return _Stage(name, samples)
+    if(not prof.sampleNext(name)):
+        return _NO_STAGE
+    return _Stage(name, samples, PROFILE_EVERY)
+
+# Pass on the items (e.g. blocks of sound) of an iterator, timing the making of each as a stage
+#   size(item): the samples in an item, e.g. lambda b: b[1].shape[1] for (first sample, block) pairs
+def profiledIter(items, name, size=None):
+    items = iter(items)
+    while True:
+        st = stage(name)
+        st.__enter__()
+        try:
+            item = next(items)
+        except StopIteration:
+            # Nothing was made, so there is no stage to count
+            return
+        if(size is not None):
+            st.samples = size(item)
+        st.__exit__(None, None, None)
+        yield item
+
+
+# ---- Collecting and reporting
+
+# Collects the stages while it is running and sums them up.
+#   with Profiler() as prof:
+#       sonifier.run("M51", 10)
+#   print(formatProfile(prof.report()))
+#   prof.writeTrace("trace.json")
+class Profiler:
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+        self._sampling = {}
+        self._random = random.Random()
+        self.start = None
+        self.wall = None
+        self.cpu = None
+
+    def __call__(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    # Whether to time this call of a sampledStage(): one picked at random from each PROFILE_EVERY
+    # calls of it, from any thread
+    def sampleNext(self, name):
+        with self._lock:
+            n, pick = self._sampling.get(name) or (0, self._random.randrange(PROFILE_EVERY))
+            timed = (n == pick)
+            if(timed):
+                pick = (n // PROFILE_EVERY + 1) * PROFILE_EVERY + self._random.randrange(PROFILE_EVERY)
+            self._sampling[name] = (n + 1, pick)
+            return timed
+
+    def begin(self):
+        self.start = time.perf_counter()
+        self._cpu0 = time.process_time()
+        addHook(self)
+
+    def end(self):
+        removeHook(self)
+        self.wall = time.perf_counter() - self.start
+        self.cpu = time.process_time() - self._cpu0
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, *exc):
+        self.end()
+        return False
+
+    # The wall and CPU time, peak memory, samples and samples per second of each stage (in
+    # the order they first finished), and of the whole run
+    def report(self):
+        stages = {}
+        for ev in self.events:
+            s = stages.setdefault(ev["stage"], {"calls": 0, "wallSeconds": 0.0, "cpuSeconds": 0.0,
+                                                "maxRssMB": None, "samples": None, "sampled": False})
+            s["calls"] += ev["weight"]
+            s["wallSeconds"] += ev["wall"] * ev["weight"]
+            s["cpuSeconds"] += ev["cpu"] * ev["weight"]
+            if(ev["maxRssMB"] is not None):
+                s["maxRssMB"] = max(s["maxRssMB"] or 0.0, ev["maxRssMB"])
+            if(ev["samples"] is not None):
+                s["samples"] = (s["samples"] or 0) + ev["samples"] * ev["weight"]
+            s["sampled"] = s["sampled"] or ev["weight"] > 1
+        for s in stages.values():
+            s["samplesPerSecond"] = s["samples"] / s["wallSeconds"] if s["samples"] and s["wallSeconds"] > 0 else None
+        return {"wallSeconds": self.wall, "cpuSeconds": self.cpu, "maxRssMB": maxRssMB(),
+                "sampledEvery": PROFILE_EVERY, "stages": stages}
+
+    # The stages as Chrome trace events, one "complete" event for each
+    def trace(self):
+        pid = os.getpid()
+        events = [{"name": ev["stage"], "ph": "X", "ts": (ev["start"] - self.start) * 1e6, "dur": ev["wall"] * 1e6,
+                   "pid": pid, "tid": ev["thread"],
+                   "args": {"cpuSeconds": ev["cpu"], "maxRssMB": ev["maxRssMB"], "samples": ev["samples"], "weight": ev["weight"]}}
+                  for ev in self.events]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def writeJson(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def writeTrace(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.trace(), f)
+
+# A report from Profiler.report() as a table
+def formatProfile(report):
+    lines = ["{:16s} {:>8s} {:>10s} {:>10s} {:>10s} {:>14s}".format("Stage", "Calls", "Wall (s)", "CPU (s)", "Peak (MB)", "Samples/s")]
+    for name, s in report["stages"].items():
+        lines.append("{:16s} {:>8s} {:10.3f} {:10.3f} {:>10s} {:>14s}".format(
+            name + ("*" if s["sampled"] else ""), str(s["calls"]), s["wallSeconds"], s["cpuSeconds"],
+            "{:.0f}".format(s["maxRssMB"]) if s["maxRssMB"] is not None else "-",
+            "{:.4g}".format(s["samplesPerSecond"]) if s["samplesPerSecond"] else "-"))
+    lines.append("{:16s} {:>8s} {:10.3f} {:10.3f} {:>10s}".format("Total", "", report["wallSeconds"], report["cpuSeconds"],
+                                                                    "{:.0f}".format(report["maxRssMB"]) if report["maxRssMB"] is not None else "-"))
+    if(any(s["sampled"] for s in report["stages"].values())):
+        lines.append("* Estimated from one in "+str(report["sampledEvery"]))
+    return "\n".join(lines)
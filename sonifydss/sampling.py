@@ -0,0 +1,91 @@
+"""
+Sampling pixel values along paths through the DSS images.
+
+A path is just a set of (x, y) pixel coordinates, of any shape, e.g. (rings, points) for the
+radial sweep. The coordinates are turned into flat pixel indices (and weights, for bilinear
+interpolation) once, and every channel is then gathered in a single fancy-indexing operation.
+The indices for the radial sweep's rings are cached, so sweeping the same sized image again
+costs nothing (images too big to hold in memory are sampled a few rings and points at a time
+instead, see sonifydss.mapped); other sweep geometries (spirals, diagonals, Lissajous figures, ...) only need to
+supply their coordinates to pathIndex() to use the same machinery.
+"""
+
+import numpy as np
+import math
+from functools import lru_cache
+
+
+# ---- Generic paths
+
+# Flat pixel indices and weights for sampling an image of the given shape at (xs, ys)
+#   xs, ys: row and column coordinates (in pixels) of each point on the path, any shape
+#   Returns (indices, weights), each (corners, *xs.shape). With nearest-pixel sampling there
+#   is just one "corner" with a weight of one, with bilinear interpolation there are four.
+def pathIndex(xs, ys, shape, bilinear=False):
+    xs = np.asarray(xs, float)
+    ys = np.asarray(ys, float)
+
+    if(not bilinear):
+        # Nearest pixel (np.rint rounds halves to even, as round() does)
+        _x = np.clip(np.rint(xs).astype(np.intp), 0, shape[0]-1)
+        _y = np.clip(np.rint(ys).astype(np.intp), 0, shape[1]-1)
+        return (_x * shape[1] + _y)[np.newaxis], np.ones((1,) + xs.shape)
+
+    # The four pixels around each point and how much of each to use
+    _x0 = np.clip(np.floor(xs).astype(np.intp), 0, shape[0]-2)
+    _y0 = np.clip(np.floor(ys).astype(np.intp), 0, shape[1]-2)
+    _fx = np.clip(xs - _x0, 0.0, 1.0)
+    _fy = np.clip(ys - _y0, 0.0, 1.0)
+    idx = np.stack((_x0 * shape[1] + _y0, _x0 * shape[1] + _y0 + 1,
+                    (_x0+1) * shape[1] + _y0, (_x0+1) * shape[1] + _y0 + 1))
+    wts = np.stack(((1-_fx) * (1-_fy), (1-_fx) * _fy, _fx * (1-_fy), _fx * _fy))
+    return idx, wts
+
+# Gather the pixel values along a path from a stack of images
+#   imgs: (channels, rows, columns)
+#   Returns (channels, *path shape)
+def gatherPath(imgs, idx, wts):
+    flat = imgs.reshape(imgs.shape[0], -1)
+    if(idx.shape[0] == 1):
+        return flat[:, idx[0]]
+    return np.sum(flat[:, idx] * wts.astype(flat.dtype, copy=False), axis=1)
+
+
+# ---- Radial sweep
+
+# Middle of the image, radius that just meets the closest edge, and the number of rings
+# and points around each ring
+def radialGeometry(shape):
+    midpt = np.array([shape[0]/2, shape[1]/2])
+    rad = math.floor(midpt[0]-1) if (midpt[0]<midpt[1]) else math.floor(midpt[1]-1)
+    numSnds = rad
+    numPts = math.ceil(2.0 * math.pi * rad)
+    return midpt, rad, numSnds, numPts
+
+# The (x, y) coordinates of points k0 to k1 around rings p0 to p1, as (rings, points) each
+def ringPath(shape, p0, p1, k0, k1):
+    midpt, rad, numSnds, numPts = radialGeometry(shape)
+    r = (np.arange(p0, p1) + 1) / numSnds * rad
+    ang = 2 * math.pi * np.arange(k0, k1) / numPts
+    xs = midpt[0] + np.multiply.outer(r, np.sin(ang))
+    ys = midpt[1] + np.multiply.outer(r, np.cos(ang))
+    return xs, ys
+
+# Indices (and weights) of the pixels around every ring, cached per image shape
+@lru_cache(maxsize=16)
+def ringIndex(shape, bilinear=False):
+    _, _, numSnds, numPts = radialGeometry(shape)
+    xs, ys = ringPath(shape, 0, numSnds, 0, numPts)
+
+    idx, wts = pathIndex(xs, ys, shape, bilinear)
+    # These are shared by everything that uses the cache, so make sure nobody changes them
+    idx.flags.writeable = False
+    wts.flags.writeable = False
+    return idx, wts
+
+# Sample a stack of images in rings around the middle for a radial sweep
+#   imgs: (channels, rows, columns)
+#   Returns (channels, rings, points)
+def sampleRings(imgs, bilinear=False):
+    idx, wts = ringIndex(tuple(imgs.shape[1:]), bilinear)
+    return gatherPath(imgs, idx, wts)
@@ -0,0 +1,209 @@
+"""
+A whole sonification, one stage at a time:
+
+    fetch -> sample -> synthesize -> encode
+
+Each stage keeps what it makes for the next, so the stages can be run (and timed, or swapped for
+your own) separately, e.g.
+
+    s = Sonifier(imageParameters, soundParameters)
+    s.fetch("M51", 10)
+    s.sample()
+    s.synthesize()
+    s.encode()
+
+or all together with s.run("M51", 10). Each stage (and the steps inside them) can be timed with
+sonifydss.profiling. The parameter dictionaries are the same as the command
+line builds (see sonifydss.cli.makeParameters). Nothing beyond numpy is imported until a stage
+needs it, so the images can come from anywhere (setImages) without astropy, and a sound can be
+made and written without matplotlib, ffmpeg or an audio device. playStream() plays the sound
+as it is generated (and writes it too).
+
+There can be any number of images (one for each survey, imgpars["surveys"]), and the sound has the
+output channels of sndpars["layout"] (see sonifydss.channels).
+
+Sounds with a seed (sndpars["seed"]) are kept in the render cache (see sonifydss.cache) when there
+is a cache directory (imgpars["cacheDir"]) and room for them (imgpars["renderMB"]), and read back
+from it rather than generated again (fromCache says whether they were).
+"""
+
+import numpy as np
+
+from sonifydss.synth import sweepSynth, renderBlocks, synthDtype
+from sonifydss.sweeps import sweepPartials
+from sonifydss.channels import outputChannels
+from sonifydss.cache import renderCachePath, renderCacheGet, renderCachePut, renderCacheBlocks
+from sonifydss.profiling import stage, profiledIter
+
+
+class Sonifier:
+
+    def __init__(self, imgpars, sndpars):
+        self.imgpars = imgpars
+        self.sndpars = sndpars
+        self.imgs = None
+        self.partials = None
+        self.sound = None
+        self.imgRGB = None
+        self.fromCache = False
+        self._renderPath = None
+
+    # ---- The stages
+
+    # Get the images of a field, one for each survey (from the cache, SkyView or wherever
+    # imgpars["source"] says)
+    def fetch(self, objcoo, angsize):
+        from sonifydss.fetch import getDSSdata
+        return self.setImages(*getDSSdata(objcoo, angsize, self.imgpars))
+
+    # Use images from somewhere else instead (e.g. left and right, all the same size)
+    def setImages(self, *imgs):
+        self.imgs = list(imgs)
+        self.partials = None
+        self.sound = None
+        self.imgRGB = None
+        self._renderPath = None
+        return self.imgs
+
+    # The number of channels of the sound
+    def numChannels(self):
+        return outputChannels(len(self.imgs), self.sndpars)
+
+    # Sample the images along the "sweep": the rows, frequencies and phases of the partials
+    def sample(self):
+        if(self.imgs is None):
+            raise RuntimeError("No images to sample: fetch() or setImages() first")
+        with stage("sample"):
+            self.partials = sweepPartials(self.imgs, self.sndpars)
+        self.sound = None
+        return self.partials
+
+    # Generate the whole sound in memory as (channels, samples)
+    def synthesize(self, progress=True):
+        cached = self._cachedRender()
+        if(cached is not None):
+            self.sound = np.array(cached)
+            return self.sound
+        partials = self._partials()
+        with stage("synthesize", self.sndpars["soundLenSam"]):
+            self.sound = sweepSynth(*partials, self.sndpars, progress)
+        if(self._renderFile()):
+            renderCachePut(self._renderFile(), self.sound, self.imgpars["cacheDir"], self.imgpars["renderMB"])
+        return self.sound
+
+    # Generate the sound a block at a time instead, as (first sample, block) pairs
+    def blocks(self):
+        cached = self._cachedRender()
+        if(cached is not None):
+            from sonifydss.output import channelBlocks
+            return channelBlocks(cached)
+        blocks = profiledIter(renderBlocks(*self._partials(), self.sndpars), "synthesize", lambda b: b[1].shape[1])
+        if(self._renderFile()):
+            blocks = renderCacheBlocks(blocks, self._renderFile(), (self.numChannels(), self.sndpars["soundLenSam"]), synthDtype(self.sndpars),
+                                       self.imgpars["cacheDir"], self.imgpars["renderMB"])
+        return blocks
+
+    # Write the sound to sndpars["filename"]. If it has not been synthesized it is generated and
+    # written a block at a time, so it never has to be held in memory all at once.
+    def encode(self, progress=True):
+        from sonifydss.output import writeSound, writeSoundStream
+        if(self.sound is None):
+            cached = self._cachedRender()
+            if(cached is not None):
+                writeSound(cached, self.sndpars)
+                return
+            writeSoundStream(self.blocks(), self.numChannels(), self.sndpars, progress)
+        else:
+            writeSound(self.sound, self.sndpars)
+
+    # All of the above. With stream=True the sound is never held in memory all at once.
+    def run(self, objcoo, angsize, stream=False, progress=True):
+        self.fetch(objcoo, angsize)
+        self.sample()
+        if(not stream):
+            self.synthesize(progress)
+        self.encode(progress)
+
+    # ---- Extras
+
+    # A colour version of the images (memory mapped images are read in for this), made once for
+    # both the picture and the movie
+    def rgb(self):
+        if(self.imgRGB is None):
+            from sonifydss.pictures import DSS2RGB
+            with stage("rgb"):
+                self.imgRGB = DSS2RGB(*[np.asarray(img) for img in self.imgs])
+        return self.imgRGB
+
+    # Make a picture of the images and their colour version
+    def picture(self, picfil):
+        from sonifydss.pictures import makePicture
+        from sonifydss.channels import imageRoles
+        imgRGB = self.rgb()
+        names = self.imageNames()
+        roles = imageRoles(len(self.imgs), self.sndpars.get("layout", "stereo"), self.sndpars.get("pan", False))
+        # e.g. "DSS2 Red+Blue" rather than "DSS2 Red+DSS2 Blue"
+        _w = names[0].split()[0] if names[0].split() else ""
+        short = [n[len(_w)+1:] if n.startswith(_w+" ") else n for n in names[1:]]
+        with stage("picture"):
+            makePicture([np.asarray(img) for img in self.imgs], imgRGB, picfil,
+                        [n+": "+r for n, r in zip(names, roles)], "+".join(names[:1]+short))
+
+    # Make a movie of the "sweep" over the colour image, with the (already written) sound
+    def movie(self, movfil):
+        from sonifydss.pictures import makeMovie
+        imgRGB = self.rgb()
+        with stage("movie"):
+            makeMovie(imgRGB, self.sndpars, movfil, self.sndpars["filename"])
+
+    # Play the sound, reading it back from the output file if it is not in memory
+    def play(self):
+        from sonifydss.output import playSound
+        sound = self.sound
+        if(sound is None):
+            import soundfile as sf
+            _snd, _ = sf.read(self.sndpars["filename"])
+            sound = _snd.reshape(len(_snd), -1).T
+        playSound(sound, self.sndpars)
+
+    # Play the sound while it is generated, writing it to sndpars["filename"] at the same time (as
+    # encode() does when it has not been synthesized). device is a sounddevice device (None for the
+    # default) or "null" to play to nowhere. Returns how it went (see playback.StreamPlayer.report).
+    def playStream(self, device=None):
+        from sonifydss.output import writeSoundStream
+        from sonifydss.playback import StreamPlayer, playbackGain
+        rows = self._partials()[0]
+        player = StreamPlayer(self.numChannels(), self.sndpars, playbackGain(rows, self.sndpars), device)
+        writeSoundStream(player.play(self.blocks()), self.numChannels(), self.sndpars, progress=False)
+        return player.report()
+
+    # What each image is called: its survey (or FITS file), as far as is known
+    def imageNames(self):
+        import os
+        if(self.imgpars.get("fitsFiles") and len(self.imgpars["fitsFiles"]) == len(self.imgs)):
+            return [os.path.basename(f) for f in self.imgpars["fitsFiles"]]
+        if(len(self.imgpars.get("surveys", [])) == len(self.imgs)):
+            return list(self.imgpars["surveys"])
+        return ["Image "+str(k+1) for k in range(0, len(self.imgs))]
+
+    # Where the sound is kept in the render cache, or None if it is not kept
+    def _renderFile(self):
+        if(not self.imgpars.get("cacheDir") or not self.imgpars.get("renderMB") or self.sndpars.get("seed") is None):
+            return None
+        if(self._renderPath is None):
+            self._renderPath = renderCachePath(self.imgpars["cacheDir"], self.imgs, self.sndpars)
+        return self._renderPath
+
+    # The sound from the render cache (memory mapped), or None if it is not there
+    def _cachedRender(self):
+        self.fromCache = False
+        if(self._renderFile()):
+            cached = renderCacheGet(self._renderFile())
+            self.fromCache = cached is not None
+            return cached
+        return None
+
+    def _partials(self):
+        if(self.partials is None):
+            self.sample()
+        return self.partials
@@ -0,0 +1,116 @@
+"""
+Turning a stack of images (one for each survey) into the rows, frequencies and phases of a sound,
+and into the sound itself, for each of the "sweep" directions. However many images there are,
+they are sampled together as one (images, partials, points) stack, and the sound comes out with
+the output channels of sndpars["layout"] (see sonifydss.channels).
+"""
+
+import numpy as np
+
+from sonifydss.synth import sweepSynth, renderBlocks, partialFreqs, partialPhases, synthDtype
+from sonifydss.mapped import stackRows, ringRows, asImage
+from sonifydss.bands import bandRows
+from sonifydss.panning import panRows, panGains
+
+# The directions a sweep can go in (sndpars["sweepDirn"]; sndpars["flipDirn"] reverses them)
+SWEEP_DIRNS = ["LR", "TB", "RAD"]
+
+
+# ---- Set up the basic sonifying functions
+
+# Convert a row of values from each image, (images, points), to a sound of a given frequency
+def row2sound(rows, freq, phs, sndpars):
+    return sweepSynth(np.asarray(rows)[:, np.newaxis, :], [freq], [phs], sndpars, progress=False)
+
+# The rings, frequencies and phases for a radial sweep
+def radialPartials(imgs, sndpars):
+
+    # Gather all the rings of every image at once
+    rings = ringRows(imgs, sndpars["bilinear"])
+    numSnds = rings.shape[1]
+
+    # We'll need some random phases to start with
+    phs = partialPhases(numSnds, sndpars.get("seed"))
+
+    # The frequences of each ring.
+    freqs = partialFreqs(numSnds, sndpars)
+
+    return rings, freqs, phs
+
+# Loop around the images to create a radial sweep
+def radialSweep(imgs, sndpars):
+
+    return sweepSynth(*radialPartials(imgs, sndpars), sndpars)
+
+# The rows, frequencies and phases for a left-to-right sweep
+def left2rightPartials(imgs, sndpars):
+
+    numSnds = imgs[0].shape[0]
+
+    # We'll need some random phases to start with
+    phs = partialPhases(numSnds, sndpars.get("seed"))
+
+    # The frequences of each row.
+    freqs = partialFreqs(numSnds, sndpars)
+
+    # Each row of the images is one partial
+    return stackRows(imgs), freqs, phs
+
+# Left-to-right sweep
+def left2rightSweep(imgs, sndpars):
+
+    return sweepSynth(*left2rightPartials(imgs, sndpars), sndpars)
+
+# The columns, frequencies and phases for a top-to-bottom sweep
+def top2bottomPartials(imgs, sndpars):
+
+    numSnds = imgs[0].shape[1]
+
+    # We'll need some random phases to start with
+    phs = partialPhases(numSnds, sndpars.get("seed"))
+
+    # The frequences of each column.
+    freqs = partialFreqs(numSnds, sndpars)
+
+    # Each column of the images is one partial
+    return stackRows(imgs, transpose=True), freqs, phs
+
+# Top-to-bottom sweep
+def top2bottomSweep(imgs, sndpars):
+
+    return sweepSynth(*top2bottomPartials(imgs, sndpars), sndpars)
+
+# The rows, frequencies and phases for a sweep in the direction given in the sound parameters
+def sweepPartials(imgs, sndpars):
+
+    # Sample the images in the precision the sound is generated in (memory mapped images are
+    # only read a slice at a time, see sonifydss.mapped)
+    imgs = [asImage(img, synthDtype(sndpars)) for img in imgs]
+
+    if sndpars["sweepDirn"] == "LR":
+        partials = left2rightPartials(imgs, sndpars)
+    elif sndpars["sweepDirn"] == "TB":
+        partials = top2bottomPartials(imgs, sndpars)
+    elif sndpars["sweepDirn"] == "RAD":
+        partials = radialPartials(imgs, sndpars)
+    else:
+        raise ValueError("Unknown sweep direction: "+str(sndpars["sweepDirn"])+" (can be "+", ".join(SWEEP_DIRNS)+")")
+
+    # Fewer partials than rows? Each band of rows becomes one partial (see sonifydss.bands)
+    numBands = sndpars.get("bands")
+    if numBands and numBands < partials[0].shape[1]:
+        rows = bandRows(partials[0], numBands, sndpars.get("bandAggregate", "mean"))
+        partials = rows, partialFreqs(numBands, sndpars), partialPhases(numBands, sndpars.get("seed"))
+
+    # Each partial placed by where it is rather than each image (see sonifydss.panning)
+    if(sndpars.get("pan")):
+        rows = panRows(partials[0], panGains(partials[0].shape, sndpars["sweepDirn"], sndpars.get("layout", "stereo")))
+        partials = (rows,) + tuple(partials[1:])
+
+    return partials
+
+# Generate a sweep in the direction given in the sound parameters block by block
+#   (see writeSoundStream)
+def sweepBlocks(imgs, sndpars):
+
+    return renderBlocks(*sweepPartials(imgs, sndpars), sndpars)
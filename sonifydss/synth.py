@@ -0,0 +1,460 @@
+"""
+Batched synthesis engine for SonifyDSS.
+
+Every sweep (left-to-right, top-to-bottom, radial) boils down to the same thing: a stack of
+pixel "rows", one per partial, each of which sets the amplitude envelope of a sine wave at a
+fixed frequency. Rather than building an interpolator and a full-length sound for each row in
+turn, the envelopes of all rows are interpolated together and the partials are summed block by
+block (envelope block x sine-bank block), so the whole image is rendered in a few vectorised passes.
+
+The sound can be generated in double (the default) or single precision (sndpars["dtype"]).
+Single precision halves the memory and memory bandwidth every step needs, and is several times
+quicker, but needs some care to stay well below the 16 bit quantisation noise of the output: the
+phases of the sine bank are worked out in double precision every PHASE_SAMPLES samples, and the
+partial blocks are added up with compensated summation.
+
+The sines themselves come from np.sin (the default), or from a bank of rotating phasors
+(sndpars["oscillator"] == "phasor", see PhasorBank) which needs just one complex multiply per sample.
+
+The envelopes are a straight line between pixels (the default), or a smoother curve through them
+(sndpars["interp"]: "cubic" for Catmull-Rom, "sinc" for a Lanczos windowed sinc). Either way the
+interpolation is the same for every row, so each time block works out an "interpolation plan" (the
+pixels each sample needs and their weights) just once, and every row is a gather and weighted sum.
+"""
+
+import numpy as np
+import math
+import progressbar
+from fractions import Fraction
+from functools import lru_cache
+
+from sonifydss.mapped import asRows
+from sonifydss.channels import channelMix, mixBlocks, outputChannels
+from sonifydss.profiling import sampledStage
+
+# Largest and smallest number of audio samples in each time block, the number of pixels
+# each block aims to span and the number of partials in each partial block
+BLOCK_SAMPLES = 8192
+MIN_BLOCK_SAMPLES = 512
+BLOCK_PIXELS = 8
+BLOCK_PARTIALS = 64
+
+# Number of samples between the double precision phases of a single precision sine bank
+PHASE_SAMPLES = 256
+
+# The envelope interpolation kernels, and how many pixels either side of a sample each one uses
+INTERP_KERNELS = {"linear": 1, "cubic": 2, "sinc": 3}
+
+# Points per pixel the lowest value of a smooth (not linear) envelope is looked for at, and
+# the number of steps per pixel the weights of the smooth kernels are tabulated at (the weights
+# of the nearest step are within about 1e-5 of the exact ones)
+MIN_POINTS_PER_PIXEL = 8
+KERNEL_TABLE_STEPS = 65536
+
+
+# ---- Set up the things that every sweep needs
+
+# The frequencies of each partial (row)
+def partialFreqs(numSnds, sndpars):
+    freqs = sndpars["freqMinHz"] + (np.arange(0,numSnds) * (sndpars["freqMaxHz"]-sndpars["freqMinHz"])/numSnds)
+    if(sndpars["flipFreq"]):
+        freqs = np.flip(freqs, axis=None)
+    return freqs
+
+# The precision the sound is generated in: float64 (default) or float32
+def synthDtype(sndpars):
+    return np.dtype(sndpars.get("dtype", "float64"))
+
+# Some random phases to start each partial with (the same ones every time for a given seed)
+def partialPhases(numSnds, seed=None):
+    if(seed is None):
+        return np.random.rand(numSnds) * 2.0 * math.pi
+    return np.random.default_rng(seed).random(numSnds) * 2.0 * math.pi
+
+# The position along a row (in pixels) of the given samples of the final sound. Samples
+# beyond either end carry on in a straight line.
+def samplePositions(samples, numPts, sndpars):
+    lenSam = sndpars["soundLenSam"]
+    if(sndpars["flipDirn"]):
+        samples = (lenSam-1) - samples
+    return samples * ((numPts-1)/lenSam)
+
+# The pixel to the left of each position and the fraction of the way to the next pixel
+def pixelWeights(pos, numPts):
+    idx = np.clip(pos.astype(np.intp), 0, numPts-2)
+    return idx, pos - idx
+
+# The weight of a pixel x pixels from a sample for each smooth kernel
+def kernelWeights(x, kernel):
+    _a = np.abs(x)
+    if(kernel == "cubic"):
+        return np.where(_a <= 1, (1.5*_a - 2.5)*_a*_a + 1, np.where(_a < 2, ((-0.5*_a + 2.5)*_a - 4)*_a + 2, 0.0))
+    _w = INTERP_KERNELS["sinc"]
+    return np.where(_a < _w, np.sinc(x) * np.sinc(x/_w), 0.0)
+
+# The pixels either side of a sample that a smooth kernel uses, relative to the one to its left
+def kernelOffsets(kernel):
+    _w = INTERP_KERNELS[kernel]
+    return np.arange(1-_w, _w+1)
+
+# The weights of those pixels for a sample at each of KERNEL_TABLE_STEPS+1 steps from one pixel
+# to the next, as (taps, steps). Sinc weights only add up to about one, so they are scaled to make sure a
+# flat row stays flat.
+@lru_cache(maxsize=None)
+def kernelTable(kernel):
+    _f = np.arange(0, KERNEL_TABLE_STEPS+1) / KERNEL_TABLE_STEPS
+    wts = kernelWeights(_f - kernelOffsets(kernel)[:, None], kernel)
+    wts = wts / np.sum(wts, axis=0)
+    wts.flags.writeable = False
+    return wts
+
+# The interpolation plan for envelopes at the given positions (in pixels) along rows of numPts:
+#   idx: the pixels each position needs, (taps, positions)
+#   wts: the weight of each of those pixels, (taps, positions)
+# Linear envelopes carry on in a straight line beyond either end, the smooth ones repeat the end pixels.
+# The smooth kernels' weights come from the nearest step of kernelTable(), which is worked out once,
+# so a plan costs about the same whatever the kernel.
+def interpPlan(pos, numPts, kernel="linear"):
+    _lo, _f = pixelWeights(pos, numPts)
+    if(kernel == "linear"):
+        return np.stack((_lo, _lo+1)), np.stack((1.0-_f, _f))
+    if(kernel not in INTERP_KERNELS):
+        raise ValueError("Unknown interpolation: "+str(kernel)+" (can be "+", ".join(INTERP_KERNELS)+")")
+    _j = (np.clip(_f, 0.0, 1.0) * KERNEL_TABLE_STEPS + 0.5).astype(np.intp)
+    return np.clip(_lo + kernelOffsets(kernel)[:, None], 0, numPts-1), kernelTable(kernel)[:, _j]
+
+# An interpolation plan as a dense (pixels, positions) matrix of weights, for pixels from the
+# first one it needs to the last
+def planMatrix(plan, dtype):
+    idx, wts = plan
+    _i0 = np.amin(idx)
+    _n = idx.shape[1]
+    _p = np.amax(idx)+1-_i0
+    # The taps can share a pixel at the ends, so their weights are added up rather than just put in
+    mat = np.bincount(((idx-_i0)*_n + np.arange(0, _n)).ravel(), wts.ravel(), _p*_n)
+    return mat.reshape(_p, _n).astype(dtype, copy=False)
+
+# The samples between the control points the envelopes are worked out at (sndpars["controlRate"],
+# in Hz), or None to work them out at every sample
+def controlStep(sndpars):
+    rate = sndpars.get("controlRate")
+    if(not rate):
+        return None
+    step = int(round(sndpars["sampleRate"] / rate))
+    return step if step > 1 else None
+
+# The samples of the control points (every step'th sample of the whole sound) from the one at or
+# before sample s to the one at or after sample e-1
+def controlSamples(s, e, step):
+    return np.arange(s // step, (e-1) // step + 2) * step
+
+# The interpolation plan for the envelopes at control samples c. When the control points are more
+# than a pixel apart each one is the average of the envelope over the step around it, so that no
+# pixel (e.g. a star) falls between them and goes unheard.
+def controlPlan(c, numPts, step, sndpars):
+    sub = max(1, math.ceil(step * (numPts-1) / sndpars["soundLenSam"]))
+    _o = ((np.arange(0, sub) + 0.5) / sub - 0.5) * step if sub > 1 else np.zeros(1)
+    idx, wts = interpPlan(samplePositions((c[:, None] + _o).ravel(), numPts, sndpars), numPts, sndpars.get("interp", "linear"))
+    # sub times as many taps, each with 1/sub of the weight
+    _k = idx.shape[0] * sub
+    return (idx.reshape(-1, len(c), sub).transpose(0, 2, 1).reshape(_k, len(c)),
+            wts.reshape(-1, len(c), sub).transpose(0, 2, 1).reshape(_k, len(c)) / sub)
+
+# Apply an interpolation plan, where take(i) gives the values at pixels i (one for each position)
+def applyPlan(take, plan, dtype):
+    idx, wts = plan
+    wts = wts.astype(dtype, copy=False)
+    if(idx.shape[0] == 2):
+        # A straight line through the pixels either side
+        _a = take(idx[0])
+        return _a + (take(idx[1]) - _a) * wts[1]
+    vals = take(idx[0]) * wts[0]
+    for k in range(1, idx.shape[0]):
+        vals += take(idx[k]) * wts[k]
+    return vals
+
+# How the envelopes of every row are worked out for samples s to e of the final sound, and so how
+# the rows and the sine bank make the sound (see apply()). The plan only depends on where the
+# samples are along the rows, so it is worked out once for every time block and shared by all the
+# partial blocks.
+#   i0, i1: the pixels of the rows the block needs
+# Without a control rate the envelopes are interpolated at every sample ("pixels", as (idx, wts)),
+# for linear by gathering the pixels either side and for the smooth kernels with a (pixels, samples)
+# matrix ("mat"). With one, they are worked out at the control points (see controlPlan(), "mat" is
+# then (pixels, control points)) and are a straight line between them ("ctrl", as (idx, wts) over
+# control points).
+class BlockPlan:
+
+    def __init__(self, s, e, numPts, sndpars):
+        kernel = sndpars.get("interp", "linear")
+        dtype = synthDtype(sndpars)
+        step = controlStep(sndpars)
+        self.ctrl = None
+        self.mat = None
+        if(step is None):
+            self.pixels = interpPlan(samplePositions(np.arange(s, e), numPts, sndpars), numPts, kernel)
+        else:
+            _c = controlSamples(s, e, step)
+            self.pixels = controlPlan(_c, numPts, step, sndpars)
+            _lo, _f = pixelWeights((np.arange(s, e) - _c[0]) / step, len(_c))
+            self.ctrl = np.stack((_lo, _lo+1)), np.stack((1.0-_f, _f))
+        self.i0 = np.amin(self.pixels[0])
+        self.i1 = np.amax(self.pixels[0]) + 1
+        self.t = np.arange(0, e-s)
+        if(step is not None or kernel != "linear"):
+            self.mat = planMatrix(self.pixels, dtype)
+        if(self.ctrl is not None and self.i1 - self.i0 <= self.mat.shape[1]):
+            # Fewer pixels than control points: quicker to mix the pixels, with their weights
+            # at every sample going in a straight line between the control points
+            self.mat = applyPlan(lambda i: self.mat[:, i], self.ctrl, dtype)
+            self.ctrl = None
+
+    # The sound of some rows (channels, partials, pixels i0 to i1) with their sine bank (partials, samples),
+    # summed over the partials, as (channels, samples)
+    def apply(self, rows, bank):
+        if(self.ctrl is not None):
+            # The envelopes at the control points, each times the sine bank: (channels, control points, samples)
+            mix = np.matmul(np.matmul(rows, self.mat.astype(rows.dtype, copy=False)).transpose(0, 2, 1), bank)
+            return applyPlan(lambda i: mix[:, i, self.t], self.ctrl, rows.dtype)
+
+        # Each pixel column times the sine bank: (channels, pixels, samples). The envelope is a
+        # weighted sum of pixels, so the sound is the same weighted sum of the mixes of those pixels.
+        mix = np.matmul(rows.transpose(0, 2, 1), bank)
+        if(self.mat is None):
+            return applyPlan(lambda i: mix[:, i - self.i0, self.t], self.pixels, rows.dtype)
+        return np.einsum('cps,ps->cs', mix, self.mat.astype(rows.dtype, copy=False))
+
+# A progress bar in the same style everywhere
+def makeProgressBar(maxval):
+    pb_widgets = ['Progress: ', 
+                  progressbar.GranularBar(), "", 
+                  progressbar.ETA()]
+    return progressbar.ProgressBar(max_value=maxval, widgets=pb_widgets).start()
+
+
+# ---- The engine itself
+
+# The samples (before any flip) an interpolated envelope has to be evaluated at to find how high
+# or low it goes. Between pixels a linear envelope is a straight line, so it turns only at the
+# samples either side of a pixel. A smooth one can overshoot its pixels, so it is taken
+# MIN_POINTS_PER_PIXEL times a pixel.
+def envelopeSamples(numPts, sndpars):
+    lenSam = sndpars["soundLenSam"]
+    if(sndpars.get("interp", "linear") == "linear"):
+        _n = np.floor(np.arange(0, numPts) * (lenSam/(numPts-1))).astype(np.intp)
+        return np.unique(np.clip(np.concatenate((_n-1, _n, _n+1)), 0, lenSam-1))
+    return np.unique(np.linspace(0, lenSam-1, min(lenSam, (numPts-1)*MIN_POINTS_PER_PIXEL+1)).astype(np.intp))
+
+# The lowest value of each interpolated envelope, as (channels, partials, 1), from the samples of
+# envelopeSamples(). With a control rate the envelope is a straight line between the control
+# points, so only those are needed. The rows are read BLOCK_PARTIALS at a time, so they need not
+# all be in memory (see sonifydss.mapped).
+def envelopeMin(rows, sndpars):
+    numPts = rows.shape[2]
+    lenSam = sndpars["soundLenSam"]
+    step = controlStep(sndpars)
+    if(step is not None):
+        plan = controlPlan(controlSamples(0, lenSam, step), numPts, step, sndpars)
+    else:
+        plan = interpPlan(envelopeSamples(numPts, sndpars) * ((numPts-1)/lenSam), numPts, sndpars.get("interp", "linear"))
+    mins = []
+    for p in range(0, rows.shape[1], BLOCK_PARTIALS):
+        _r = rows[:, p:p+BLOCK_PARTIALS]
+        env = applyPlan(lambda i: _r[:, :, i], plan, float)
+        mins.append(np.amin(env, axis=2, keepdims=True))
+    return np.concatenate(mins, axis=1).astype(rows.dtype, copy=False)
+
+# Number of samples in each time block. Blocks are kept short enough that each one only
+# spans a few pixels along the rows, which keeps the envelope x sine-bank products small.
+def blockLength(numPts, sndpars):
+    _spp = sndpars["soundLenSam"] / max(1, numPts-1)
+    return int(min(BLOCK_SAMPLES, max(MIN_BLOCK_SAMPLES, BLOCK_PIXELS * _spp)))
+
+# Angular frequencies and starting phases of the partials (the random phases are offsets in time)
+def partialOmegas(freqs, phs):
+    omega = 2*np.pi*np.asarray(freqs, float)
+    phase0 = omega * np.asarray(phs, float)
+    return omega, phase0
+
+# The sines of partials p to q for samples s to e, as (partials, samples), in the precision of dtype.
+#   In single precision omega*t would lose far too much of the phase as t gets large, so the
+#   phase is worked out in double precision (and wrapped) at the start of every PHASE_SAMPLES
+#   samples, and only the small steps from there are single precision.
+def sineBank(omega, phase0, p, q, s, e, sndpars, dtype):
+    sr = sndpars["sampleRate"]
+    if(dtype == np.float64):
+        bank = np.multiply.outer(omega[p:q], np.arange(s, e) / sr)
+        bank += phase0[p:q, None]
+        return np.sin(bank, out=bank)
+
+    numSub = -(-(e-s) // PHASE_SAMPLES)
+    _start = np.mod(np.multiply.outer(omega[p:q], (s + PHASE_SAMPLES*np.arange(0, numSub)) / sr)
+                    + phase0[p:q, None], 2*np.pi).astype(dtype)
+    _step = np.multiply.outer(omega[p:q].astype(dtype), (np.arange(0, PHASE_SAMPLES) / sr).astype(dtype))
+    bank = np.add(_start[:, :, None], _step[:, None, :]).reshape(q-p, numSub*PHASE_SAMPLES)[:, :e-s]
+    return np.sin(bank, out=bank)
+
+# A bank of sine oscillators made by turning phasors rather than calling sin for every sample.
+#   Each partial's phasor (a complex number of unit length) is turned by exp(i*omega*PHASE_SAMPLES/sampleRate)
+#   from one stretch of PHASE_SAMPLES samples to the next, and the samples within a stretch are it
+#   times a table of exp(i*omega*k/sampleRate). The phasors carry on from one block to the next,
+#   so the sound can be made in blocks of any length, and are brought back to unit length after
+#   each block so that rounding errors cannot make them grow or shrink. phasorDrift() measures how
+#   far their phases wander over a long sound.
+class PhasorBank:
+
+    # Start the phasors at sample s
+    def __init__(self, omega, phase0, s, sndpars):
+        sr = sndpars["sampleRate"]
+        self.state = np.exp(1j * np.mod(omega * (s / sr) + phase0, 2*np.pi))
+        self.step = np.exp(1j * omega * (PHASE_SAMPLES / sr))
+        self.table = np.exp(1j * np.multiply.outer(omega, np.arange(0, PHASE_SAMPLES) / sr))
+        self._tables = {}
+
+    # The phasors at the start of each stretch of the next n samples, for partials p to q
+    def _stretches(self, p, q, n):
+        numSub = -(-n // PHASE_SAMPLES)
+        z = np.empty((q-p, numSub), complex)
+        z[:, 0] = self.state[p:q]
+        z[:, 1:] = self.step[p:q, None]
+        return np.cumprod(z, axis=1)
+
+    # The sines of partials p to q for the next n samples, as (partials, samples), in the precision of dtype.
+    #   Only the imaginary part of each product is needed, so it is worked out from the real and
+    #   imaginary parts separately (which is quicker than a complex multiply).
+    def sines(self, p, q, n, dtype):
+        if(dtype not in self._tables):
+            self._tables[dtype] = (self.table.real.astype(dtype), self.table.imag.astype(dtype))
+        _cos, _sin = self._tables[dtype]
+        z = self._stretches(p, q, n)
+        bank = np.multiply(z.real.astype(dtype)[:, :, None], _sin[p:q, None, :])
+        bank += z.imag.astype(dtype)[:, :, None] * _cos[p:q, None, :]
+        return bank.reshape(q-p, -1)[:, :n]
+
+    # Move every phasor on by n samples
+    def advance(self, n):
+        numSub, _r = divmod(n, PHASE_SAMPLES)
+        z = self.state
+        for _ in range(0, numSub):
+            z = z * self.step
+        z = z * self.table[:, _r]
+        self.state = z / np.abs(z)
+
+# How far the phases of a PhasorBank wander from the exact phases over a sound of the given
+# length (in seconds) made in blocks of blkLen samples. Returns the largest phase error (in radians).
+def phasorDrift(freqs, seconds, blkLen, sndpars):
+    sr = sndpars["sampleRate"]
+    omega = 2*np.pi*np.asarray(freqs, float)
+    osc = PhasorBank(omega, np.zeros(omega.shape), 0, sndpars)
+    lenSam = int(seconds * sr)
+    for s in range(0, lenSam, blkLen):
+        osc.advance(min(blkLen, lenSam - s))
+
+    # The exact phases, from the fraction of a cycle each partial is through at the end
+    exact = np.array([float(Fraction(f) * lenSam / sr % 1) for f in freqs]) * 2*np.pi
+    return float(np.amax(np.abs(np.angle(osc.state * np.exp(-1j * exact)))))
+
+# The sound of partials p to q (summed) for samples s to e, as (channels, samples)
+#   osc:  a PhasorBank at sample s to take the sines from, or None to use sin
+#   plan: the BlockPlan for samples s to e, if already worked out
+def partialBlock(rows, omega, phase0, p, q, s, e, sndpars, osc=None, plan=None):
+
+    # The interpolation is the same for every row, so the plan is worked out once for the
+    # block. Only the pixels it passes over are needed.
+    if(plan is None):
+        plan = BlockPlan(s, e, rows.shape[2], sndpars)
+
+    with sampledStage("oscillator", (q-p)*(e-s)):
+        if(osc is None):
+            bank = sineBank(omega, phase0, p, q, s, e, sndpars, rows.dtype)
+        else:
+            bank = osc.sines(p, q, e-s, rows.dtype)
+    with sampledStage("accumulate", (q-p)*(e-s)):
+        return plan.apply(rows[:, p:q, plan.i0:plan.i1], bank)
+
+# The oscillators the sound parameters ask for, starting at sample s: a PhasorBank, or None for sin
+def makeOscillator(omega, phase0, s, sndpars):
+    if(sndpars.get("oscillator", "sin") == "phasor"):
+        return PhasorBank(omega, phase0, s, sndpars)
+    return None
+
+# Add up the sounds of several partial blocks. In single precision this uses Kahan (compensated)
+# summation, so the rounding errors do not grow with the number of partial blocks.
+def sumBlocks(parts, shape, dtype):
+    total = np.zeros(shape, dtype)
+    if(dtype == np.float64):
+        for part in parts:
+            total += part
+        return total
+
+    comp = np.zeros(shape, dtype)
+    for part in parts:
+        _y = part - comp
+        _t = total + _y
+        comp = (_t - total) - _y
+        total = _t
+    return total
+
+# The sound of all the partials (summed) for samples s to e, as (channels, samples)
+def spanBlock(rows, omega, phase0, s, e, sndpars, osc=None):
+    numSnds = rows.shape[1]
+    plan = BlockPlan(s, e, rows.shape[2], sndpars)
+    return sumBlocks((partialBlock(rows, omega, phase0, p, min(p + BLOCK_PARTIALS, numSnds), s, e, sndpars, osc, plan)
+                      for p in range(0, numSnds, BLOCK_PARTIALS)), (rows.shape[0], e-s), rows.dtype)
+
+# Generate the sound in time blocks.
+#   rows:  array of (channels, partials, points) pixel values, one row per partial
+#   freqs: frequency (Hz) of each partial
+#   phs:   starting phase of each partial
+# Yields (first sample, block) pairs where block is (channels, samples in block)
+def synthBlocks(rows, freqs, phs, sndpars):
+    numChan, numSnds, numPts = rows.shape
+    lenSam = sndpars["soundLenSam"]
+    blkLen = blockLength(numPts, sndpars)
+    dtype = synthDtype(sndpars)
+    rows = asRows(rows, dtype)
+
+    # Subtract the lowest value from each row?
+    if(sndpars["minSubtract"]):
+        rows = rows - envelopeMin(rows, sndpars)
+
+    # Angular frequencies and starting phases
+    omega, phase0 = partialOmegas(freqs, phs)
+    osc = makeOscillator(omega, phase0, 0, sndpars)
+
+    for s in range(0, lenSam, blkLen):
+        e = min(s + blkLen, lenSam)
+
+        # Add up the partials a block at a time
+        block = spanBlock(rows, omega, phase0, s, e, sndpars, osc)
+        if(osc is not None):
+            osc.advance(e-s)
+
+        yield s, block
+
+# Generate the sound in time blocks with whichever engine the sound parameters ask for, with one
+# channel for each image (channel of the rows), mixed to the output channels (see sonifydss.channels)
+def renderBlocks(rows, freqs, phs, sndpars):
+    if(sndpars["engine"] == "ifft"):
+        from sonifydss.ifft import ifftBlocks
+        blocks = ifftBlocks(rows, freqs, phs, sndpars)
+    elif(sndpars["workers"] > 1):
+        from sonifydss.parallel import parallelBlocks
+        blocks = parallelBlocks(rows, freqs, phs, sndpars)
+    else:
+        blocks = synthBlocks(rows, freqs, phs, sndpars)
+    return mixBlocks(blocks, channelMix(rows.shape[0], sndpars))
+
+# Generate the whole sound (optionally with a progress bar) as an array of (output channels, samples)
+def sweepSynth(rows, freqs, phs, sndpars, progress=True):
+    lenSam = sndpars["soundLenSam"]
+    sound = np.zeros((outputChannels(rows.shape[0], sndpars), lenSam), synthDtype(sndpars))
+
+    if(progress):
+        pbar = makeProgressBar(lenSam)
+    for s, block in renderBlocks(rows, freqs, phs, sndpars):
+        sound[:, s:s+block.shape[1]] = block
+        if(progress):
+            pbar.update(s+block.shape[1])
+
+    return sound